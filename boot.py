@@ -0,0 +1,24 @@
+# boot.py — A/B slot shim
+#
+# In the A/B OTA layout the application lives in /slot_a or /slot_b and
+# /slot.json names the active one. MicroPython runs main.py from the current
+# directory after boot.py, so changing into the slot boots its main.py and
+# puts its modules first on the import path. Keep this file tiny: it is
+# never replaced by a slot update.
+
+import json
+import os
+import sys
+
+try:
+    with open("/slot.json") as f:
+        _slot = json.load(f).get("active")
+except Exception:
+    _slot = None
+
+if _slot in ("slot_a", "slot_b"):
+    try:
+        os.chdir("/" + _slot)
+        sys.path.insert(1, f"/{_slot}/lib")
+    except OSError:
+        pass  # Slot missing: fall back to the flat tree at the root
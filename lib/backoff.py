@@ -0,0 +1,41 @@
+# backoff.py
+
+import random
+import machine
+
+
+def device_offset_ms(span_ms):
+    """ Stable per-device offset in [0, span_ms), derived from the chip's unique ID """
+    if span_ms <= 0:
+        return 0
+    seed = 0
+    try:
+        for b in machine.unique_id():
+            seed = (seed * 31 + b) & 0x3FFFFFFF
+    except Exception:
+        seed = random.getrandbits(30)
+    return seed % span_ms
+
+
+class Backoff:
+    """ Exponential backoff between base_ms and max_ms with ±jitter randomisation """
+
+    def __init__(self, base_ms, max_ms, factor=2, jitter=0.2):
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.factor = factor
+        self.jitter = jitter
+        self.current_ms = base_ms
+
+    def reset(self):
+        """ Drop back to the base interval (something changed) """
+        self.current_ms = self.base_ms
+
+    def next_ms(self):
+        """ Return the delay to wait now and grow the following one """
+        delay = self.current_ms
+        self.current_ms = min(self.max_ms, int(self.current_ms * self.factor))
+        spread = int(delay * self.jitter)
+        if spread > 0:
+            delay += random.getrandbits(30) % (2 * spread + 1) - spread
+        return max(0, delay)
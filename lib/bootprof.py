@@ -0,0 +1,57 @@
+# bootprof.py
+#
+# Boot timeline. main.py calls mark(name) as each boot phase completes;
+# ticks_ms counts from reset, so every mark is "ms since power-on".
+# save() appends the timeline to a small JSON history on flash.
+
+import json
+import time
+
+PROFILE_FILE = "/bootprof.json"
+KEEP = 5  # Boot profiles kept on flash
+
+_marks = []
+
+
+def mark(name):
+    """ Record that phase name finished now """
+    _marks.append((name, time.ticks_ms()))
+
+
+def marks():
+    return list(_marks)
+
+
+def summary():
+    """ One line: each phase with its duration, then the total """
+    parts, prev = [], 0
+    for name, t in _marks:
+        parts.append("%s +%d" % (name, time.ticks_diff(t, prev)))
+        prev = t
+    return "%s = %d ms" % (", ".join(parts), prev)
+
+
+def profiles():
+    """ Saved profiles, oldest first """
+    try:
+        with open(PROFILE_FILE) as f:
+            return json.load(f)
+    except:
+        return []
+
+
+def save(keep=KEEP):
+    """ Append this boot's marks to PROFILE_FILE, keeping the last keep profiles """
+    history = profiles()
+    entry = {"marks": [[name, t] for name, t in _marks]}
+    try:
+        import machine
+        entry["reset_cause"] = machine.reset_cause()
+    except Exception:
+        pass
+    history.append(entry)
+    try:
+        with open(PROFILE_FILE, "w") as f:
+            json.dump(history[-keep:], f)
+    except OSError:
+        pass
@@ -1,11 +1,205 @@
+# config_loader.py
+#
+# Config store over /config.json. Values are flattened to "section.key" and
+# merged over DEFAULTS, which double as the schema: an unknown key, or a value
+# whose type does not match its default (or that is not one of CHOICES, or
+# fails its SHAPES check) is reported and the default kept. Lookups are plain
+# dict hits on the cached flat view.
+#
+# poll() re-parses the file only when its size or mtime changed and then
+# calls the subscribers of every prefix whose keys changed, so a pushed
+# config.json retunes a running device without a reboot.
+
+import uasyncio as asyncio
 import json
+import os
 
 CONFIG_PATH = "/config.json"
+WATCH_MS = 10 * 1000  # How often watch() stats the file
+
+DEFAULTS = {
+    "wifi.ssid": "",
+    "wifi.password": "",
+    "wifi.static_ip": None,                 # [ip, mask, gateway, dns]
+    "wifi.reuse_lease": False,
+    "wifi.poll_ms": 50,
+    "wifi.fast_timeout_ms": 3000,
+    "wifi.connect_timeout_ms": 20000,
+    "wifi.retry_min_ms": 2000,
+    "wifi.retry_max_ms": 5 * 60 * 1000,
+    "reachability.method": "tcp",
+    "reachability.target": "clients3.google.com:80",
+    "reachability.min_s": 5,
+    "reachability.max_s": 300,
+    "reachability.timeout": 3,
+    "ota.repo_url": "https://raw.githubusercontent.com/liftronix/pi_pico_test/refs/heads/main",
+    "ota.layout": "flat",
+    "ota.mpy": True,
+    "ota.poll_min_ms": 60 * 1000,           # Poll interval right after boot or a change
+    "ota.poll_max_ms": 60 * 60 * 1000,      # Backoff ceiling while nothing changes
+    "ota.min_free_mem": 100 * 1024,
+    "ota.min_free_block": 24 * 1024,        # Largest block a TLS handshake + manifest parse needs
+    "ota.flash_buffer": 16 * 1024,          # Flash safety margin over the update size
+    "mem.auto_tune": False,                 # Let memtel retune gc.threshold from measured headroom
+    "mem.collect_below": 0,                 # gc.collect() when a memtel sample sees less free heap (0 = off)
+    "log.console_level": "DEBUG",
+    "log.file_level": "DEBUG",
+    "log.max_size": 10 * 1024,              # Text log rotation size (unused with the segment store)
+    "status.enabled": True,
+    "status.port": 80,
+    "status.max_clients": 2,
+    "status.console": False,                # Periodic WiFi/IP prints on the serial console
+    "boot.fast": True,
+    "boot.repl_pin": None,                  # GPIO held low at power-on for the REPL delay
+    "debug.profile_tasks": False,
+    "debug.slow_resume_us": 20000,
+}
+
+_LEVELS = ("DEBUG", "INFO", "WARN", "ERROR", "OFF")
+CHOICES = {
+    "ota.layout": ("flat", "ab"),
+    "reachability.method": ("dns", "tcp", "http"),
+    "log.console_level": _LEVELS,
+    "log.file_level": _LEVELS,
+}
+
+def _ip_config(value):
+    return value is None or (isinstance(value, list) and len(value) == 4
+                             and all(isinstance(v, str) for v in value))
+
+def _pin(value):
+    return value is None or (isinstance(value, int) and not isinstance(value, bool))
+
+# Checks for values a default's type cannot describe: (predicate, expected)
+SHAPES = {
+    "wifi.static_ip": (_ip_config, "[ip, mask, gateway, dns] strings"),
+    "boot.repl_pin": (_pin, "GPIO number or null"),
+}
+
+def _flatten(tree, prefix="", out=None):
+    out = {} if out is None else out
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            _flatten(value, prefix + key + ".", out)
+        else:
+            out[prefix + key] = value
+    return out
+
+def _valid(value, default):
+    # null is only a value for keys that default to it; those get a SHAPES check
+    if default is None:
+        return True
+    if isinstance(default, bool):
+        return isinstance(value, bool)
+    if isinstance(default, int):  # sleep_ms() and friends reject floats on MicroPython
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, type(default))
+
+class ConfigStore:
+    def __init__(self, path=CONFIG_PATH, defaults=DEFAULTS, choices=CHOICES, shapes=SHAPES):
+        self.path = path
+        self.defaults = defaults
+        self.choices = choices
+        self.shapes = shapes
+        self.raw = {}  # Parsed file, as load_config() always returned it
+        self.errors = []  # "key: reason" for every value that was rejected
+        self._values = dict(defaults)
+        self._subs = []
+        self._stamp = self._read_stamp()
+        self.reload()
+
+    def get(self, key, default=None):
+        """ Value of a flat key such as "ota.poll_min_ms" """
+        return self._values.get(key, default)
+
+    def get_int(self, key, default=0):
+        value = self._values.get(key)
+        return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else default
+
+    def get_bool(self, key, default=False):
+        value = self._values.get(key)
+        return value if isinstance(value, bool) else default
+
+    def get_str(self, key, default=""):
+        value = self._values.get(key)
+        return value if isinstance(value, str) else default
+
+    def section(self, name):
+        """ {key: value} of one section, defaults included """
+        prefix = name + "."
+        n = len(prefix)
+        return {k[n:]: v for k, v in self._values.items() if k.startswith(prefix)}
+
+    def subscribe(self, prefix, callback):
+        """ Call callback(store, changed_keys) after a reload changes keys starting with prefix """
+        self._subs.append((prefix, callback))
+
+    def _read_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st[6], st[8])
+        except OSError:
+            return None
+
+    def poll(self):
+        """ Reload if the file's size or mtime changed; returns the set of changed keys """
+        stamp = self._read_stamp()
+        if stamp == self._stamp:
+            return set()
+        self._stamp = stamp
+        return self.reload()
+
+    def reload(self):
+        try:
+            with open(self.path) as f:
+                raw = json.load(f)
+        except Exception as e:
+            print(f"[Config] Failed to load: {e}")
+            if self.raw:
+                return set()  # Keep running on the last good config (e.g. caught mid-write)
+            raw = {}
+        self.raw = raw
+        values = dict(self.defaults)
+        self.errors = []
+        for key, value in _flatten(raw).items():
+            if key not in self.defaults:
+                self.errors.append(f"{key}: unknown key")
+                continue
+            default = self.defaults[key]
+            allowed = self.choices.get(key)
+            shape = self.shapes.get(key)
+            if not _valid(value, default):
+                self.errors.append(f"{key}: expected {type(default).__name__}")
+            elif allowed and value not in allowed:
+                self.errors.append(f"{key}: not one of {allowed}")
+            elif shape and not shape[0](value):
+                self.errors.append(f"{key}: expected {shape[1]}")
+            else:
+                values[key] = value
+        for err in self.errors:
+            print(f"[Config] Ignoring {err}")
+        changed = {k for k in values if values[k] != self._values.get(k)}
+        changed.update(k for k in self._values if k not in values)
+        self._values = values
+        if changed:
+            self._notify(changed)
+        return changed
+
+    def _notify(self, changed):
+        for prefix, callback in self._subs:
+            keys = [k for k in changed if k.startswith(prefix)]
+            if keys:
+                try:
+                    callback(self, keys)
+                except Exception as e:
+                    print(f"[Config] Subscriber for {prefix} failed: {e}")
+
+    async def watch(self, interval_ms=WATCH_MS):
+        """ Poll for changes forever; run as a background task """
+        while True:
+            await asyncio.sleep_ms(interval_ms)
+            self.poll()
 
 def load_config():
-    try:
-        with open(CONFIG_PATH) as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"[Config] Failed to load: {e}")
-        return {}
\ No newline at end of file
+    """ Parsed /config.json as a plain dict (no defaults applied) """
+    return ConfigStore().raw
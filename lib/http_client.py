@@ -0,0 +1,255 @@
+# http_client.py
+
+import uasyncio as asyncio
+import socket
+import json
+import reachability
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+def _parse_url(url):
+    """ Split a URL into (use_ssl, host, port, path) """
+    scheme, _, rest = url.partition("://")
+    if scheme == "https":
+        use_ssl, port = True, 443
+    elif scheme == "http":
+        use_ssl, port = False, 80
+    else:
+        raise ValueError(f"Unsupported URL scheme: {scheme}")
+    host, slash, path = rest.partition("/")
+    path = "/" + path if slash else "/"
+    if ":" in host:
+        host, p = host.split(":", 1)
+        port = int(p)
+    return use_ssl, host, port, path
+
+
+class Response:
+    def __init__(self, reader, writer, status, headers, timeout, release=None):
+        self.status = status
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+        self._timeout = timeout
+        self._release = release  # Called with (reader, writer) to hand a drained connection back
+        self._chunked = "chunked" in headers.get("transfer-encoding", "")
+        length = headers.get("content-length")
+        self._remaining = int(length) if length is not None else -1  # -1 → until close
+        self._chunk_left = 0
+        self._eof = status in (204, 304) or self._remaining == 0
+        self.reusable = (self._chunked or self._remaining >= 0 or self._eof) and \
+            headers.get("connection", "").lower() != "close"
+
+    async def _read_line(self):
+        return await asyncio.wait_for(self._reader.readline(), self._timeout)
+
+    async def _next_chunk(self):
+        # Returns the size of the next chunk, or 0 at the terminating chunk
+        line = await self._read_line()
+        size = int(line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            while (await self._read_line()) not in (b"\r\n", b"\n", b""):
+                pass
+        return size
+
+    async def readinto(self, buf):
+        """ Read up to len(buf) body bytes into buf; returns 0 at end of body """
+        if self._eof:
+            return 0
+        want = len(buf)
+        if self._chunked:
+            if self._chunk_left == 0:
+                self._chunk_left = await self._next_chunk()
+                if self._chunk_left == 0:
+                    self._eof = True
+                    return 0
+            want = min(want, self._chunk_left)
+        elif self._remaining >= 0:
+            want = min(want, self._remaining)
+        target = buf if want == len(buf) else memoryview(buf)[:want]
+        n = await asyncio.wait_for(self._reader.readinto(target), self._timeout)
+        if not n:
+            if self._chunked or self._remaining > 0:
+                raise OSError("Connection closed mid-body")
+            self._eof = True
+            return 0
+        if self._chunked:
+            self._chunk_left -= n
+            if self._chunk_left == 0:
+                await self._read_line()  # CRLF after chunk data
+        elif self._remaining > 0:
+            self._remaining -= n
+            if self._remaining == 0:
+                self._eof = True
+        return n
+
+    async def read(self):
+        """ Read the whole remaining body (small payloads only) """
+        parts = []
+        buf = bytearray(512)
+        while True:
+            n = await self.readinto(buf)
+            if not n:
+                break
+            parts.append(bytes(buf[:n]))
+        return b"".join(parts)
+
+    async def text(self):
+        return (await self.read()).decode()
+
+    async def json(self):
+        return json.loads(await self.read())
+
+    async def close(self):
+        """ Release the connection: back to the session if drained and reusable, else close it """
+        release, self._release = self._release, None
+        if release and self._eof and self.reusable:
+            release(self._reader, self._writer)
+            return
+        await _close_stream(self._writer)
+
+
+async def _close_stream(writer):
+    try:
+        writer.close()
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+async def _send(reader, writer, method, host, path, headers, keep_alive, timeout):
+    """ Write the request and parse the response head; returns (status, headers) """
+    lines = [f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"]
+    lines.append("Connection: keep-alive\r\n" if keep_alive else "Connection: close\r\n")
+    for k, v in (headers or {}).items():
+        lines.append(f"{k}: {v}\r\n")
+    lines.append("\r\n")
+    writer.write("".join(lines).encode())
+    await asyncio.wait_for(writer.drain(), timeout)
+
+    status_line = await asyncio.wait_for(reader.readline(), timeout)
+    if not status_line:
+        raise OSError("Connection closed by server")
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+        raise ValueError(f"Bad status line: {status_line}")
+    status = int(parts[1])
+
+    resp_headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = line.decode().partition(":")
+        resp_headers[k.strip().lower()] = v.strip()
+    if parts[0] == b"HTTP/1.0" and resp_headers.get("connection", "").lower() != "keep-alive":
+        resp_headers["connection"] = "close"
+    return status, resp_headers
+
+
+def _redirect_url(url, location):
+    if location.startswith("/"):
+        use_ssl, host, port, _ = _parse_url(url)
+        return f"{'https' if use_ssl else 'http'}://{host}:{port}{location}"
+    return location
+
+
+class Session:
+    """ Keeps one HTTP/1.1 keep-alive connection per host for a run of requests.
+
+    Resolved addresses are cached for the life of the session, so a batch of
+    fetches from the same host costs one DNS lookup and one TCP/TLS handshake.
+    A pooled connection the server has since closed is replaced transparently.
+    """
+
+    def __init__(self, timeout=10, keep_alive=True):
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._conns = {}  # (host, port) → (reader, writer), idle only
+        self._addrs = {}  # (host, port) → resolved IP
+
+    def _resolve(self, host, port):
+        key = (host, port)
+        addr = self._addrs.get(key)
+        if addr is None:
+            addr = socket.getaddrinfo(host, port)[0][-1][0]
+            self._addrs[key] = addr
+        return addr
+
+    async def _connect(self, use_ssl, host, port):
+        addr = self._resolve(host, port)
+        if use_ssl:
+            conn = asyncio.open_connection(addr, port, ssl=True, server_hostname=host)
+        else:
+            conn = asyncio.open_connection(addr, port)
+        return await asyncio.wait_for(conn, self.timeout)
+
+    def _release(self, key):
+        def release(reader, writer):
+            old = self._conns.get(key)
+            self._conns[key] = (reader, writer)
+            if old:
+                old[1].close()
+        return release
+
+    async def _open(self, method, url, headers):
+        use_ssl, host, port, path = _parse_url(url)
+        key = (host, port)
+        pooled = self._conns.pop(key, None) if self.keep_alive else None
+        while True:
+            if pooled:
+                reader, writer = pooled
+            else:
+                reader, writer = await self._connect(use_ssl, host, port)
+            try:
+                status, resp_headers = await _send(
+                    reader, writer, method, host, path, headers, self.keep_alive, self.timeout)
+            except (OSError, ValueError) as e:
+                await _close_stream(writer)
+                if not pooled:
+                    raise
+                pooled = None  # Server dropped the idle connection; retry on a fresh one
+                continue
+            except BaseException:
+                await _close_stream(writer)
+                raise
+            reachability.mark_success()  # Any response proves the network is up
+            release = self._release(key) if self.keep_alive else None
+            return Response(reader, writer, status, resp_headers, self.timeout, release)
+
+    async def request(self, method, url, headers=None, max_redirects=3):
+        """ Send a request; the caller must close() the returned Response """
+        for _ in range(max_redirects + 1):
+            resp = await self._open(method, url, headers)
+            location = resp.headers.get("location")
+            if resp.status not in REDIRECT_CODES or not location:
+                return resp
+            await resp.read()  # Drain so the connection can be reused
+            await resp.close()
+            url = _redirect_url(url, location)
+        raise OSError(f"Too many redirects: {url}")
+
+    async def get(self, url, headers=None):
+        return await self.request("GET", url, headers=headers)
+
+    async def close(self):
+        """ Close all pooled connections and forget cached addresses """
+        conns, self._conns = self._conns, {}
+        for _, writer in conns.values():
+            await _close_stream(writer)
+        self._addrs = {}
+
+
+async def request(method, url, headers=None, timeout=10, max_redirects=3):
+    """ Send a one-off HTTP/1.1 request without blocking the event loop.
+
+    The caller must close() the returned Response. Redirects are followed up
+    to max_redirects; timeout (seconds) applies to every network wait.
+    """
+    session = Session(timeout=timeout, keep_alive=False)
+    return await session.request(method, url, headers=headers, max_redirects=max_redirects)
+
+
+async def get(url, headers=None, timeout=10):
+    return await request("GET", url, headers=headers, timeout=timeout)
@@ -0,0 +1,128 @@
+# integrity.py
+#
+# Integrity index for the installed tree. integrity.json sits next to
+# manifest.json and records, per file, its size, SHA-256 and a cheap change
+# stamp. verify_installation() trusts entries whose stamp is unchanged and
+# re-hashes only the rest, so a boot-time check costs a stat() per file.
+
+import uasyncio as asyncio
+import os
+import json
+import hashlib
+import binascii
+
+INDEX_NAME = "integrity.json"
+BUF_SIZE = 4096  # One buffer per verification, reused for every file
+EXCLUDE = ("config.json", "output_info.txt")  # User-owned files the manifest does not pin
+
+
+def _stamp(st):
+    # Cheap change stamp: size and mtime. littlefs keeps mtime on rp2; where it
+    # is 0 the size alone still catches truncated or partial writes.
+    return "%d:%d" % (st[6], st[8])
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except:
+        return {}
+
+
+def write_json(path, data):
+    """ Write-then-rename, so a power cut leaves either the old or the new file """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    try:
+        os.rename(tmp, path)
+    except OSError:  # FAT cannot rename over an existing file
+        os.remove(path)
+        os.rename(tmp, path)
+
+
+async def _hash(path, buf):
+    mv = memoryview(buf)
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(mv[:n])
+            await asyncio.sleep_ms(0)
+    return binascii.hexlify(h.digest()).decode()
+
+
+def record(entries, root=""):
+    """ Add {path: sha256} for files just written and verified (e.g. by an OTA apply) """
+    index_path = f"{root}/{INDEX_NAME}"
+    index = _load(index_path)
+    files = index.setdefault("files", {})
+    for path, sha in entries.items():
+        try:
+            st = os.stat(f"{root}/{path}")
+        except OSError:
+            files.pop(path, None)
+            continue
+        files[path] = [st[6], sha, _stamp(st)]
+    write_json(index_path, index)
+
+
+async def verify_installation(root="", exclude=EXCLUDE, full=False):
+    """ Check the installed tree under root against root/manifest.json.
+
+    Files whose change stamp matches the index are trusted; only new or
+    changed ones are re-hashed (all of them with full=True). The index is
+    updated with what was hashed. Returns a dict with ok, version, total,
+    hashed, missing and corrupt.
+    """
+    manifest = _load(f"{root}/manifest.json")
+    expected = manifest.get("files", {})
+    index_path = f"{root}/{INDEX_NAME}"
+    index = _load(index_path)
+    files = index.get("files", {})
+    result = {"ok": bool(expected), "version": manifest.get("version"), "total": 0,
+              "hashed": 0, "missing": [], "corrupt": []}
+    buf = None
+    dirty = index.get("version") != manifest.get("version")
+    for path, meta in expected.items():
+        if path in exclude:
+            continue
+        result["total"] += 1
+        full_path = f"{root}/{path}"
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            result["missing"].append(path)
+            result["ok"] = False
+            if files.pop(path, None):
+                dirty = True
+            continue
+        entry = files.get(path)
+        stamp = _stamp(st)
+        if not full and entry and entry[2] == stamp:
+            sha = entry[1]
+        else:
+            if buf is None:
+                buf = bytearray(BUF_SIZE)
+            sha = await _hash(full_path, buf)
+            result["hashed"] += 1
+            files[path] = [st[6], sha, stamp]
+            dirty = True
+        if sha != meta["sha256"]:
+            result["corrupt"].append(path)
+            result["ok"] = False
+    for path in list(files):
+        if path not in expected:
+            del files[path]
+            dirty = True
+    if dirty:
+        index["version"] = manifest.get("version")
+        index["files"] = files
+        try:
+            write_json(index_path, index)
+        except OSError:
+            pass
+    return result
@@ -1,37 +1,35 @@
 # ledblinker.py
+#
+# Square-wave blinker kept for existing callers. It is a thin wrapper that
+# pushes a two-step pattern onto a LEDPattern engine (its own, or a shared
+# one passed in), so blinking costs no event-loop task.
 
-import uasyncio as asyncio
-from machine import Pin
+from ledpattern import LEDPattern, PRIO_IDLE
 
 class LEDBlinker:
-    def __init__(self, pin_num, interval_ms=500):
-        self.led = Pin(pin_num, Pin.OUT)
+    def __init__(self, pin_num, interval_ms=500, engine=None, priority=PRIO_IDLE):
+        self.engine = engine or LEDPattern(pin_num)
+        self.led = self.engine.led
         self.interval = interval_ms
-        self._task = None
+        self.priority = priority
         self._running = False
 
     def set_interval(self, ms):
         """Change blink interval on-the-fly"""
         self.interval = ms
-
-    async def _blink(self):
-        while self._running:
-            self.led.toggle()
-            await asyncio.sleep_ms(self.interval)
+        if self._running:
+            self.engine.push("blink", (ms, ms), self.priority)
 
     def start(self):
-        """Begin blinking loop"""
+        """Begin blinking"""
         if not self._running:
             self._running = True
-            self._task = asyncio.create_task(self._blink())
+            self.engine.push("blink", (self.interval, self.interval), self.priority)
 
     def stop(self):
         """Stop blinking"""
         self._running = False
-        if self._task:
-            self._task.cancel()
-            self._task = None
-        self.led.value(0)  # Turn off LED when stopping
+        self.engine.pop("blink")  # LED goes off unless another pattern is pushed
 
 if __name__ == "__main__":
     import uasyncio as asyncio
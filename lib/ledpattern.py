@@ -0,0 +1,108 @@
+# ledpattern.py
+#
+# LED pattern engine. A pattern is a step table: durations in ms, alternately
+# LED on and LED off, starting with on; the table loops. Steps are played by a
+# one-shot machine.Timer that re-arms itself, so the event loop is never woken
+# and the timing holds while the loop is busy. The Pico W LED sits behind the
+# CYW43 chip and has no PWM, hence on/off steps rather than brightness.
+#
+# Patterns sit on a stack: push(name, steps, priority) shows the highest
+# priority entry (the newest on a tie) and pop(name) reveals what was beneath,
+# so OTA progress overrides the heartbeat only for as long as it is pushed.
+
+from machine import Pin, Timer
+
+HEARTBEAT = (60, 140, 60, 1740)   # Double blink every 2 s
+OTA_PROGRESS = (200, 200)         # Steady fast blink while downloading
+SAFE_MODE = (1000, 1000)          # Slow even blink: OTA and main loop skipped
+ON = (1000, 0)                    # Solid on (update ready, rebooting)
+
+PRIO_IDLE = 0
+PRIO_OTA = 10
+PRIO_ERROR = 20
+PRIO_SAFE = 30
+
+def error_code(n, on_ms=250, off_ms=250, pause_ms=1500):
+    """ n blinks then a pause, e.g. error_code(3) for "download failed" """
+    steps = [on_ms, off_ms] * n
+    steps[-1] = pause_ms
+    return tuple(steps)
+
+class LEDPattern:
+    def __init__(self, pin="LED", timer_id=-1):
+        self.led = Pin(pin, Pin.OUT)
+        self.led.value(0)
+        self._timer = Timer(timer_id)
+        self._stack = []  # [name, steps, priority, cycles left (0 = forever)]
+        self._steps = None
+        self._i = 0
+        self._cb = self._step  # Bound once: the timer callback allocates nothing per step
+
+    def push(self, name, steps, priority=PRIO_IDLE, count=0):
+        """ Show steps under name (replacing an entry of that name); count > 0 plays it that many times """
+        self._remove(name)
+        self._stack.append([name, steps, priority, count])
+        self._select()
+
+    def pop(self, name):
+        """ Drop name from the stack and resume whatever is now on top """
+        if self._remove(name):
+            self._select()
+
+    def active(self):
+        """ Name of the pattern being shown, or None """
+        top = self._top()
+        return top[0] if top else None
+
+    def stop(self):
+        """ Clear the stack and turn the LED off """
+        self._stack = []
+        self._select()
+
+    def _remove(self, name):
+        for entry in self._stack:
+            if entry[0] == name:
+                self._stack.remove(entry)
+                return True
+        return False
+
+    def _top(self):
+        top = None
+        for entry in self._stack:
+            if top is None or entry[2] >= top[2]:
+                top = entry
+        return top
+
+    def _select(self):
+        top = self._top()
+        steps = top[1] if top else None
+        if steps is self._steps:
+            return  # Already playing: keep its phase
+        self._timer.deinit()
+        self._steps = steps
+        self._i = 0
+        if steps:
+            self._step(None)
+        else:
+            self.led.value(0)
+
+    def _step(self, _timer):
+        steps = self._steps
+        if not steps:
+            return
+        i = self._i
+        if i >= len(steps):  # End of one cycle
+            i = 0
+            top = self._top()
+            if top and top[3]:
+                top[3] -= 1
+                if not top[3]:
+                    self._stack.remove(top)
+                    self._steps = None  # Restart even if what is beneath shares this table
+                    self._select()
+                    return
+        ms = steps[i]
+        self._i = i + 1
+        if ms:  # A zero step (e.g. the off step of ON) leaves the LED as it is
+            self.led.value(1 - (i & 1))
+        self._timer.init(mode=Timer.ONE_SHOT, period=ms or 1000, callback=self._cb)
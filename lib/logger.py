@@ -1,6 +1,14 @@
 # logger.py
+#
+# Messages may be passed as a format string plus arguments, e.g.
+#     logger.debug("Free memory: %d bytes", free)
+# and are only formatted when a sink (console or file) accepts the level.
+# For production builds, wrap hot-path debug calls in `if __debug__:`;
+# mpy-cross -O1 (or micropython.opt_level(1)) compiles those blocks out.
 
+import os
 import time
+import uasyncio as asyncio
 
 class Logger:
     DEBUG_MODE = True
@@ -8,36 +16,163 @@ class Logger:
     WARN_MODE = True
     ERROR_MODE = True
 
+    DEBUG, INFO, WARN, ERROR, OFF = 0, 1, 2, 3, 4
+    CONSOLE_LEVEL = DEBUG  # Lowest level printed to the console
+    FILE_LEVEL = DEBUG     # Lowest level written to the log file / segment store
+
     _RESET = "\033[0m"
-    _COLORS = {
-        "DEBUG": "\033[90m",
-        "INFO":  "\033[94m",
-        "WARN":  "\033[93m",
-        "ERROR": "\033[91m",
-    }
+    _PREFIXES = (
+        "\033[90m[DEBUG] ",
+        "\033[94m[INFO] ",
+        "\033[93m[WARNING] ",
+        "\033[91m[ERROR] ",
+    )
+    _NAMES = ("DEBUG", "INFO", "WARNING", "ERROR")
 
     LOG_FILE = "/bootlog.txt"
     MAX_LOG_SIZE = 10 * 1024  # 10 KB
 
+    # Buffered mode (see enable_buffering): records wait in a fixed-size ring
+    # and a background task appends them to the file in batches.
+    _ring = None
+    _head = 0
+    _count = 0
+    _dropped = 0
+    _flush_at = 0
+    _wake = None
+
+    # Segment store backend (see use_segment_store); None → text LOG_FILE
+    _store = None
+
     @staticmethod
     def _write_log_file(level, msg):
+        if Logger._ring is None:
+            Logger._write_batch(((time.ticks_ms(), level, msg),))
+            return
+        ring = Logger._ring
+        ring[(Logger._head + Logger._count) % len(ring)] = (time.ticks_ms(), level, msg)
+        if Logger._count == len(ring):
+            Logger._head = (Logger._head + 1) % len(ring)  # Overwrote the oldest record
+            Logger._dropped += 1
+        else:
+            Logger._count += 1
+        if Logger._count >= Logger._flush_at:
+            Logger._wake.set()
+
+    @staticmethod
+    def _write_batch(records):
         try:
+            if Logger._store is not None:
+                Logger._store.append(records)
+                return
             # Rotate log if needed
             if Logger._file_too_big():
                 with open(Logger.LOG_FILE, "w") as f:
                     f.write("🗑 Log rotated due to size\n")
-            ts = Logger._get_ts()
+            now_s, now_t = time.time(), time.ticks_ms()
             with open(Logger.LOG_FILE, "a") as f:
-                f.write(f"[{ts}] [{level}] {msg}\n")
+                for ticks, level, msg in records:
+                    ts = Logger._get_ts(now_s - time.ticks_diff(now_t, ticks) // 1000)
+                    f.write(f"[{ts}] [{level}] {msg}\n")
         except:
             pass
 
     @staticmethod
-    def _get_ts():
+    def flush():
+        """Write all buffered records to the log file now (no-op when unbuffered)"""
+        ring = Logger._ring
+        if not ring or not Logger._count:
+            return
+        records = [ring[(Logger._head + i) % len(ring)] for i in range(Logger._count)]
+        if Logger._dropped:
+            records.insert(0, (time.ticks_ms(), "WARNING", f"{Logger._dropped} log records dropped (buffer full)"))
+        Logger._head = Logger._count = Logger._dropped = 0
+        for i in range(len(ring)):
+            ring[i] = None
+        Logger._write_batch(records)
+
+    @staticmethod
+    async def _flusher():
+        while True:
+            await Logger._wake.wait()
+            Logger._wake.clear()
+            Logger.flush()
+
+    @staticmethod
+    async def _ticker(flush_ms):
+        # Time threshold: wake the flusher even if the size threshold is never hit
+        while True:
+            await asyncio.sleep_ms(flush_ms)
+            if Logger._count:
+                Logger._wake.set()
+
+    @staticmethod
+    def enable_buffering(capacity=32, flush_at=16, flush_ms=5000):
+        """Buffer file records in RAM and flush them in batches from a background task.
+
+        A batch is written once flush_at records are waiting or flush_ms has
+        passed; error() always flushes immediately. Call flush() before a reset.
+        """
+        if Logger._ring is not None:
+            return
+        Logger._ring = [None] * capacity
+        Logger._flush_at = min(flush_at, capacity)
+        Logger._wake = asyncio.Event()
+        asyncio.create_task(Logger._flusher())
+        asyncio.create_task(Logger._ticker(flush_ms))
+
+    @staticmethod
+    def _get_ts(secs):
         try:
-            return time.localtime()
+            return time.localtime(secs)
         except:
-            return time.time()
+            return secs
+
+    @staticmethod
+    def use_segment_store(prefix="/log", segments=4, segment_size=4096):
+        """Write file records to a round-robin binary segment store instead of LOG_FILE.
+
+        History survives rotation (only the oldest segment is recycled) and
+        each boot is marked so post-mortems can find where a reboot happened.
+        Decode on the host with tools/logdecode.py.
+        """
+        from logstore import SegmentLog
+        Logger._store = SegmentLog(prefix, segments, segment_size)
+        Logger._store.mark_boot(time.ticks_ms())
+
+    @staticmethod
+    def tail(n=20):
+        """Return the last n records as text lines, oldest first.
+
+        Records still waiting in the ring are served from RAM, so a status
+        request never forces a flash write; flash is read only for the rest.
+        """
+        pending = []
+        ring = Logger._ring
+        if ring:
+            for i in range(max(0, Logger._count - n), Logger._count):
+                pending.append(ring[(Logger._head + i) % len(ring)])
+        need = n - len(pending)
+        try:
+            if Logger._store is not None:
+                from logstore import BOOT
+                lines = ["%d [%s] %s" % (t, "BOOT" if lvl == BOOT else Logger._NAMES[min(lvl, 3)], m)
+                         for t, lvl, m in Logger._store.tail(need)] if need > 0 else []
+                return lines + ["%d [%s] %s" % rec for rec in pending]
+            lines = []
+            if need > 0:
+                with open(Logger.LOG_FILE) as f:
+                    for line in f:
+                        lines.append(line.rstrip("\n"))
+                        if len(lines) > need:
+                            lines.pop(0)
+        except OSError:
+            lines = []
+        now_s, now_t = time.time(), time.ticks_ms()
+        for ticks, level, msg in pending:
+            ts = Logger._get_ts(now_s - time.ticks_diff(now_t, ticks) // 1000)
+            lines.append(f"[{ts}] [{level}] {msg}")
+        return lines
 
     @staticmethod
     def _file_too_big():
@@ -47,30 +182,70 @@ class Logger:
             return False
 
     @staticmethod
-    def debug(msg):
+    def _log(level, msg, args):
+        console = level >= Logger.CONSOLE_LEVEL
+        to_file = level >= Logger.FILE_LEVEL
+        if not (console or to_file):
+            return
+        if args:
+            msg = msg % args  # Formatted once, shared by both sinks
+        if console:
+            print(Logger._PREFIXES[level], msg, Logger._RESET, sep="")
+        if to_file:
+            Logger._write_log_file(Logger._NAMES[level], msg)
+
+    @staticmethod
+    def debug(msg, *args):
         if Logger.DEBUG_MODE:
-            print(f"{Logger._COLORS['DEBUG']}[DEBUG] {msg}{Logger._RESET}")
-            Logger._write_log_file("DEBUG", msg)
+            Logger._log(0, msg, args)
 
     @staticmethod
-    def info(msg):
+    def info(msg, *args):
         if Logger.INFO_MODE:
-            print(f"{Logger._COLORS['INFO']}[INFO] {msg}{Logger._RESET}")
-            Logger._write_log_file("INFO", msg)
+            Logger._log(1, msg, args)
 
     @staticmethod
-    def warn(msg):
+    def warn(msg, *args):
         if Logger.WARN_MODE:
-            print(f"{Logger._COLORS['WARN']}[WARNING] {msg}{Logger._RESET}")
-            Logger._write_log_file("WARNING", msg)
+            Logger._log(2, msg, args)
 
     @staticmethod
-    def error(msg):
+    def error(msg, *args):
         if Logger.ERROR_MODE:
-            print(f"{Logger._COLORS['ERROR']}[ERROR] {msg}{Logger._RESET}")
-            Logger._write_log_file("ERROR", msg)
+            Logger._log(3, msg, args)
+            Logger.flush()
+
+    @staticmethod
+    def set_levels(console=None, file=None):
+        """Set per-sink thresholds (Logger.DEBUG … Logger.OFF).
+
+        Levels that no sink accepts are rebound to a no-op, so their calls
+        cost one function call and never build a message.
+        """
+        if console is not None:
+            Logger.CONSOLE_LEVEL = console
+        if file is not None:
+            Logger.FILE_LEVEL = file
+        lowest = min(Logger.CONSOLE_LEVEL, Logger.FILE_LEVEL)
+        g = globals()
+        for level, name in enumerate(_LEVEL_FUNCS):
+            fn = _IMPLS[level] if level >= lowest else _noop
+            g[name] = fn
+            setattr(Logger, name, staticmethod(fn))
+
+def _noop(msg, *args):
+    pass
+
+_LEVEL_FUNCS = ("debug", "info", "warn", "error")
+_IMPLS = (Logger.debug, Logger.info, Logger.warn, Logger.error)
 
+DEBUG, INFO, WARN, ERROR, OFF = Logger.DEBUG, Logger.INFO, Logger.WARN, Logger.ERROR, Logger.OFF
 debug = Logger.debug
 info = Logger.info
 warn = Logger.warn
 error = Logger.error
+flush = Logger.flush
+enable_buffering = Logger.enable_buffering
+use_segment_store = Logger.use_segment_store
+tail = Logger.tail
+set_levels = Logger.set_levels
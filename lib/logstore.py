@@ -0,0 +1,162 @@
+# logstore.py
+
+import os
+import struct
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+BOOT = 255  # Level byte of the boot marker record (see mark_boot)
+
+_HEADER = "<I"    # Segment header: sequence number
+_RECORD = "<IBH"  # Record header: ticks_ms, level, message length
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_RECORD_SIZE = struct.calcsize(_RECORD)
+
+
+class SegmentLog:
+    """ Round-robin log over N fixed-size segment files with compact binary records.
+
+    Each segment starts with a u32 sequence number followed by records of
+    (u32 ticks_ms, u8 level, u16 length, utf-8 message). When the current
+    segment is full the oldest one is truncated and reused, so flash use is
+    bounded and rotation never rewrites more than one small file.
+    tools/logdecode.py turns the segments back into text on the host.
+    """
+
+    def __init__(self, prefix="/log", segments=4, segment_size=4096):
+        self.prefix = prefix
+        self.segments = segments
+        self.segment_size = segment_size
+        self._index = 0
+        self._seq = 0
+        self._offset = 0
+        self._open_current()
+
+    def _path(self, i):
+        return f"{self.prefix}{i}.bin"
+
+    def _read_seq(self, i):
+        try:
+            with open(self._path(i), "rb") as f:
+                hdr = f.read(_HEADER_SIZE)
+            if len(hdr) == _HEADER_SIZE:
+                return struct.unpack(_HEADER, hdr)[0]
+        except OSError:
+            pass
+        return None
+
+    def _open_current(self):
+        # Resume appending to the segment with the highest sequence number
+        newest, best = None, 0
+        for i in range(self.segments):
+            seq = self._read_seq(i)
+            if seq is not None and (newest is None or seq > best):
+                newest, best = i, seq
+        if newest is None:
+            self._start_segment(0, 1)
+            return
+        self._index, self._seq = newest, best
+        self._offset = os.stat(self._path(newest))[6]
+        if self._scan(newest) != self._offset:
+            # A torn record at power loss would misalign everything appended after it
+            self._start_segment((newest + 1) % self.segments, best + 1)
+
+    def _scan(self, i):
+        """ Length of the well-formed prefix of segment i """
+        end = _HEADER_SIZE
+        with open(self._path(i), "rb") as f:
+            f.read(_HEADER_SIZE)
+            while True:
+                hdr = f.read(_RECORD_SIZE)
+                if len(hdr) < _RECORD_SIZE:
+                    return end
+                n = struct.unpack(_RECORD, hdr)[2]
+                if len(f.read(n)) < n:
+                    return end
+                end += _RECORD_SIZE + n
+
+    def _start_segment(self, index, seq):
+        with open(self._path(index), "wb") as f:
+            f.write(struct.pack(_HEADER, seq))
+        self._index = index
+        self._seq = seq
+        self._offset = _HEADER_SIZE
+
+    def append(self, records):
+        """ Append (ticks_ms, level_name_or_byte, message) records in one pass """
+        f = None
+        try:
+            for ticks, level, msg in records:
+                data = msg.encode() if isinstance(msg, str) else bytes(msg)
+                data = data[:self.segment_size - _HEADER_SIZE - _RECORD_SIZE]
+                if isinstance(level, str):
+                    level = LEVELS.index(level) if level in LEVELS else 0
+                size = _RECORD_SIZE + len(data)
+                if self._offset + size > self.segment_size:
+                    if f:
+                        f.close()
+                        f = None
+                    self._start_segment((self._index + 1) % self.segments, self._seq + 1)
+                if f is None:
+                    f = open(self._path(self._index), "ab")
+                f.write(struct.pack(_RECORD, ticks & 0xFFFFFFFF, level, len(data)))
+                f.write(data)
+                self._offset += size
+        finally:
+            if f:
+                f.close()
+
+    def mark_boot(self, ticks, note=""):
+        self.append(((ticks, BOOT, note),))
+
+    def _ordered_segments(self):
+        found = []
+        for i in range(self.segments):
+            seq = self._read_seq(i)
+            if seq is not None:
+                found.append((seq, i))
+        found.sort()
+        return [i for _, i in found]
+
+    def _segment_records(self, i):
+        """ Yield (ticks_ms, level, raw message bytes) of segment i """
+        with open(self._path(i), "rb") as f:
+            f.read(_HEADER_SIZE)
+            while True:
+                hdr = f.read(_RECORD_SIZE)
+                if len(hdr) < _RECORD_SIZE:
+                    break
+                ticks, level, n = struct.unpack(_RECORD, hdr)
+                data = f.read(n)
+                if len(data) < n:
+                    break  # Torn write at power loss
+                yield ticks, level, data
+
+    def records(self):
+        """ Yield (ticks_ms, level, message) from oldest to newest """
+        for i in self._ordered_segments():
+            for ticks, level, data in self._segment_records(i):
+                yield ticks, level, _decode(data)
+
+    def tail(self, n=20):
+        """ Return the last n records as a list, reading segments newest first until it has them """
+        out = []
+        if n <= 0:
+            return out
+        for i in reversed(self._ordered_segments()):
+            need = n - len(out)
+            recent = []
+            for rec in self._segment_records(i):
+                recent.append(rec)
+                if len(recent) > need:
+                    recent.pop(0)
+            out = recent + out
+            if len(out) >= n:
+                break
+        return [(ticks, level, _decode(data)) for ticks, level, data in out]
+
+
+def _decode(data):
+    try:
+        return data.decode()
+    except UnicodeError:  # Message cut mid-character by truncation
+        return str(data)
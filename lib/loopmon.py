@@ -0,0 +1,108 @@
+# loopmon.py
+
+import time
+import uasyncio as asyncio
+
+# Upper bounds (ms) of the lag histogram buckets; the last bucket is open-ended
+BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+
+class LoopMonitor:
+    """ Event-loop health: how late a periodic probe wakes up versus when it asked to.
+
+    A task that blocks the loop (a synchronous socket call, a flash write,
+    a long computation) delays every other task, including the probe. The
+    probe's lateness is recorded in a log2 histogram, so p50/p99/max show
+    whether the LED and status tasks are being starved. calibrate() measures
+    the probe's own wakeup jitter as the smallest lag seen at boot; that baseline is
+    subtracted from every sample so the numbers do not depend on the clock,
+    firmware or tick resolution. Nothing spins: the probe sleeps between samples.
+    """
+
+    def __init__(self, period_ms=100):
+        self.period_ms = period_ms
+        self.baseline_ms = 0
+        self._task = None
+        self.reset()
+
+    def reset(self):
+        """ Start a new measurement window """
+        self._hist = [0] * (len(BUCKETS) + 1)
+        self._samples = 0
+        self._max = 0
+        self._blocked = 0  # Sum of excess lag in the window (ms)
+        self._since = time.ticks_ms()
+
+    async def calibrate(self, samples=20):
+        """ Measure the idle wakeup lag.
+
+        Takes the minimum over samples: a busy boot can only add lag, so the
+        smallest one is the probe's own overhead even with other tasks running.
+        """
+        best = None
+        for _ in range(samples):
+            lag = await self._probe()
+            if best is None or lag < best:
+                best = lag
+        self.baseline_ms = best or 0
+        return self.baseline_ms
+
+    async def _probe(self):
+        due = time.ticks_add(time.ticks_ms(), self.period_ms)
+        await asyncio.sleep_ms(self.period_ms)
+        return max(0, time.ticks_diff(time.ticks_ms(), due))
+
+    def _record(self, lag):
+        i = 0
+        while i < len(BUCKETS) and lag > BUCKETS[i]:
+            i += 1
+        self._hist[i] += 1
+        self._samples += 1
+        self._blocked += lag
+        if lag > self._max:
+            self._max = lag
+
+    async def _run(self):
+        while True:
+            self._record(max(0, await self._probe() - self.baseline_ms))
+
+    def start(self):
+        """ Begin sampling in the background """
+        if self._task is None:
+            self.reset()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def percentile(self, q):
+        """ Upper bound (ms) of the bucket holding the q-th quantile (0 < q <= 1) """
+        if not self._samples:
+            return 0
+        want = q * self._samples
+        seen = 0
+        for i, n in enumerate(self._hist):
+            seen += n
+            if n and seen >= want:
+                return min(BUCKETS[i], self._max) if i < len(BUCKETS) else self._max
+        return self._max
+
+    def stats(self, reset=False):
+        """ Snapshot of the current window as a dict; optionally start a new one """
+        elapsed = max(1, time.ticks_diff(time.ticks_ms(), self._since))
+        out = {
+            "samples": self._samples,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self._max,
+            # Share of the window in which the loop could not run a ready task
+            "blocked_pct": min(100.0, 100 * self._blocked / elapsed),
+            "baseline_ms": self.baseline_ms,
+            "window_ms": elapsed,
+            "histogram": list(self._hist),
+        }
+        if reset:
+            self.reset()
+        return out
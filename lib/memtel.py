@@ -0,0 +1,137 @@
+# memtel.py
+#
+# Heap telemetry. MemoryError on the Pico is usually fragmentation rather
+# than a lack of free bytes, so besides gc.mem_free()/mem_alloc() this can
+# probe the largest block that can still be allocated. Low-water marks are
+# kept per named phase:
+#
+#     with memtel.phase("apply"):
+#         ...
+#         memtel.sample(note=file)   # Attributed to the innermost open phase
+#
+# configure() optionally retunes gc.threshold from the measured headroom and
+# collects pre-emptively when free memory drops below a floor.
+
+import gc
+
+_phases = {}    # name -> [min_free, min_largest, samples, note_at_min]
+_stack = []
+_auto_tune = False
+_collect_below = 0
+_collections = 0
+_threshold = None
+
+
+def configure(auto_tune=False, collect_below=0):
+    """ auto_tune: set gc.threshold from each phase's low-water mark.
+    collect_below: run gc.collect() whenever a sample sees less free heap than this.
+    """
+    global _auto_tune, _collect_below, _threshold
+    if _auto_tune and not auto_tune and _threshold is not None:
+        gc.threshold(-1)  # Hand allocation-triggered collection back to the default
+        _threshold = None
+    _auto_tune = auto_tune
+    _collect_below = collect_below
+
+
+def largest_block(limit=None, step=256):
+    """ Size of the largest bytearray that can be allocated now (to within step bytes) """
+    lo, hi = 0, limit or gc.mem_free()
+    while hi - lo > step:
+        mid = (lo + hi) // 2
+        try:
+            b = bytearray(mid)
+            del b
+            lo = mid
+        except MemoryError:
+            hi = mid
+    return lo
+
+
+def sample(phase=None, note=None, probe=False):
+    """ Record (free, alloc, largest) against phase or the innermost open phase.
+
+    largest is only measured when probe is set (it costs a few allocations);
+    otherwise it is reported as -1.
+    """
+    global _collections
+    free = gc.mem_free()
+    if _collect_below and free < _collect_below:
+        gc.collect()
+        _collections += 1
+        free = gc.mem_free()
+    largest = largest_block(free) if probe else -1
+    name = phase or (_stack[-1] if _stack else "idle")
+    st = _phases.get(name)
+    if st is None:
+        st = _phases[name] = [free, largest, 0, note]
+    elif free < st[0]:
+        st[0] = free
+        st[3] = note
+    if largest >= 0 and (st[1] < 0 or largest < st[1]):
+        st[1] = largest
+    st[2] += 1
+    return free, gc.mem_alloc(), largest
+
+
+def _tune(min_free):
+    # Collect after a quarter of the tightest headroom has been allocated, so
+    # the heap is compacted before a phase like this one can exhaust it
+    global _threshold
+    threshold = max(4096, min_free // 4)
+    if threshold != _threshold:
+        gc.threshold(threshold)
+        _threshold = threshold
+
+
+class _Phase:
+    def __init__(self, name, probe):
+        self.name = name
+        self.probe = probe
+
+    def __enter__(self):
+        _stack.append(self.name)
+        sample(self.name, "enter", self.probe)
+        return self
+
+    def __exit__(self, *exc):
+        sample(self.name, "exit", self.probe)
+        for i in range(len(_stack) - 1, -1, -1):
+            if _stack[i] == self.name:
+                _stack.pop(i)
+                break
+        if _auto_tune:
+            _tune(_phases[self.name][0])
+        return False
+
+
+def phase(name, probe=True):
+    """ Context manager that samples on entry and exit and tags samples taken inside """
+    return _Phase(name, probe)
+
+
+def phases():
+    """ {name: (min_free, min_largest, samples, note_at_min)} """
+    return {name: tuple(st) for name, st in _phases.items()}
+
+
+def collections():
+    """ Number of pre-emptive collections triggered by sample() """
+    return _collections
+
+
+def report():
+    """ One line per phase, tightest first """
+    lines = []
+    for name, st in sorted(_phases.items(), key=lambda kv: kv[1][0]):
+        line = "%s: min free %d" % (name, st[0])
+        if st[1] >= 0:
+            line += ", min block %d" % st[1]
+        if st[3]:
+            line += " (at %s)" % st[3]
+        lines.append(line + ", %d samples" % st[2])
+    return lines
+
+
+def reset():
+    _phases.clear()
@@ -1,30 +1,128 @@
 import uasyncio as asyncio
-import urequests as requests
 import os
+import sys
 import json
 import hashlib
 import binascii
+import struct
 import logger
+import memtel
+import integrity
+import http_client
+
+try:
+    from micropython import native
+except ImportError:  # Host tools and tests run this module on CPython
+    def native(f):
+        return f
+
+try:
+    import deflate
+except ImportError:  # Firmware older than v1.21 only has zlib.DecompIO
+    deflate = None
+    import zlib
+
+BUNDLE_MAGIC = b"OTB1"
+BUNDLE_STAGING = "bundle.bin"
+PENDING_FLAG = "/ota_pending.flag"
+COMMIT_FLAG = "/ota_commit_pending.flag"
+
+# A/B layout: firmware lives in one of two slot directories and boot.py picks
+# the active one from this pointer file. No pointer means the flat root tree.
+SLOT_POINTER = "/slot.json"
+SLOTS = ("slot_a", "slot_b")
+SLOT_STAGING = ("journal.json", "delta.json", BUNDLE_STAGING)
+
+def _read_pointer():
+    try:
+        with open(SLOT_POINTER) as f:
+            return json.load(f)
+    except:
+        return {}
+
+def _write_pointer(pointer):
+    integrity.write_json(SLOT_POINTER, pointer)
+
+def _mpy_version():
+    # Low byte of sys.implementation._mpy is the .mpy version this VM loads
+    return getattr(sys.implementation, "_mpy", 0) & 0xFF
+
+def _inflater(stream):
+    if deflate:
+        return deflate.DeflateIO(stream, deflate.ZLIB)
+    return zlib.DecompIO(stream)
+
+@native
+def _fold_crlf(buf, n):
+    # Fold CRLF to LF in buf[:n] in place and return the new length
+    j = 0
+    i = 0
+    last = n - 1
+    while i < n:
+        c = buf[i]
+        if c == 13 and i < last and buf[i + 1] == 10:
+            i += 1
+            continue
+        if i != j:
+            buf[j] = c
+        j += 1
+        i += 1
+    return j
+
+def _read_exact(stream, n):
+    data = b""
+    while len(data) < n:
+        chunk = stream.read(n - len(data))
+        if not chunk:
+            raise ValueError("Truncated bundle")
+        data += chunk
+    return data
 
 class OTAUpdater:
-    def __init__(self, repo_url, version_file="/version.txt", ota_dir="/update", backup_dir="/backup"):
+    CHUNK_SIZE = 1024  # Bytes per socket read while streaming a file to flash
+    JOURNAL_EVERY = 8 * 1024  # Checkpoint a partial download after this many bytes
+
+    def __init__(self, repo_url, version_file="/version.txt", ota_dir="/update", backup_dir="/backup", layout="flat",
+                 use_mpy=True):
         self.repo_url = repo_url.rstrip("/")
         self.manifest_url = f"{self.repo_url}/manifest.json"
         self.version_file = version_file
         self.ota_dir = ota_dir
         self.backup_dir = backup_dir
-        self.manifest = {}
-        self.files = []
+        # Compact view of the remote manifest; the parsed JSON is not kept
         self.hashes = {}
         self.sizes = {}
+        self.bundle = None
+        self.use_mpy = use_mpy  # Install precompiled .mpy modules when the manifest has a compatible set
+        self.mpy_dir = None  # Repo directory of the selected .mpy files, None when installing sources
+        self.changed = []
+        self.removed = []
+        self.local_manifest = "/manifest.json"
+        self.cache_file = "/ota_cache.json"  # Validators of the last manifest fetched
+        self._cache = None
         self.remote_version = ""
         self.progress = 0
         self.current_file = ""
+        self._buf = None
+        self._session = None
+        self._journal = None
         #Files to be excluded during OTA process
         self.user_excluded = {
             "config.json",
             "output_info.txt"
         }
+        self.layout = layout
+        self.root = ""  # Directory the running firmware lives in ("" = flash root)
+        if layout == "ab":
+            active = _read_pointer().get("active")
+            self.root = f"/{active}" if active in SLOTS else ""
+            # The inactive slot doubles as the download directory
+            self.ota_dir = "/" + (SLOTS[1] if self.root == f"/{SLOTS[0]}" else SLOTS[0])
+            self.version_file = f"{self.root}/version.txt"
+            self.local_manifest = f"{self.root}/manifest.json"
+            # The boot shim stays at the flash root, outside both slots
+            self.user_excluded = self.user_excluded | {"boot.py"}
+        self.journal_file = f"{self.ota_dir}/journal.json"
     
     #--------------------------------------------------------------------------#
     def get_progress(self):
@@ -50,7 +148,8 @@ class OTAUpdater:
             current = f"{current}/{p}" if current else f"/{p}"
             try:
                 os.mkdir(current)
-                logger.debug(f"Created directory: {current}")
+                if __debug__:  # Per-file detail, stripped from -O builds
+                    logger.debug("Created directory: %s", current)
             except:
                 pass
     
@@ -60,181 +159,779 @@ class OTAUpdater:
 
     #--------------------------------------------------------------------------#
     def _sha256(self, path):
+        buf = self._get_buffer()
+        mv = memoryview(buf)
         h = hashlib.sha256()
         with open(path, "rb") as f:
             while True:
-                chunk = f.read(1024)
-                if not chunk:
+                n = f.readinto(buf)
+                if not n:
                     break
-                h.update(chunk)
+                h.update(mv[:n])
         return binascii.hexlify(h.digest()).decode()
     
+    #--------------------------------------------------------------------------#
+    def _get_buffer(self):
+        # One buffer per updater, reused for every chunk of every file
+        if self._buf is None:
+            self._buf = bytearray(self.CHUNK_SIZE)
+        return self._buf
+
+    #--------------------------------------------------------------------------#
+    async def _copy_file(self, src, dst, expected_hash=None):
+        """Copy src to dst through the shared buffer, yielding between chunks.
+
+        With expected_hash the bytes are hashed as they are written and a
+        mismatch raises ValueError, so a bad copy never goes unnoticed.
+        """
+        buf = self._get_buffer()
+        mv = memoryview(buf)
+        h = hashlib.sha256() if expected_hash else None
+        with open(src, "rb") as r, open(dst, "wb") as w:
+            while True:
+                n = r.readinto(buf)
+                if not n:
+                    break
+                w.write(mv[:n])
+                if h:
+                    h.update(mv[:n])
+                await asyncio.sleep_ms(0)
+        if h and binascii.hexlify(h.digest()).decode() != expected_hash:
+            raise ValueError(f"Hash mismatch after copy: {dst}")
+
+    #--------------------------------------------------------------------------#
+    async def _stream_to_file(self, r, file, dest, normalize, resume=None):
+        """Stream a response body into dest chunk by chunk and return its sha256.
+
+        CRLF is folded to LF in place in the shared buffer; a trailing CR is
+        held back until the next chunk shows whether it starts with LF, and
+        written on its own if it does not. With resume=(remote, local,
+        held_cr) the first `local` bytes already on flash are rehashed and the
+        body continues after them. Progress is checkpointed to the journal.
+        """
+        buf = self._get_buffer()
+        mv = memoryview(buf)
+        h = hashlib.sha256()
+        remote, local, held_cr = resume or (0, 0, False)
+        if local:
+            f = open(dest, "r+b")
+            left = local
+            while left:
+                n = f.readinto(mv[:min(left, len(buf))])
+                if not n:
+                    f.close()
+                    raise OSError(f"Partial file shorter than journal: {dest}")
+                h.update(mv[:n])
+                left -= n
+            f.seek(local)
+        else:
+            f = open(dest, "wb")
+        with f:
+            unsaved = 0
+            while True:
+                n = await r.readinto(buf)
+                if not n:
+                    break
+                remote += n
+                unsaved += n
+                if normalize:
+                    if held_cr and buf[0] != 10:  # Held CR was not part of a CRLF
+                        h.update(b"\r")
+                        f.write(b"\r")
+                        local += 1
+                    n = _fold_crlf(buf, n)
+                    held_cr = buf[n - 1] == 13
+                    if held_cr:
+                        n -= 1
+                if n:
+                    chunk = mv[:n]
+                    h.update(chunk)
+                    f.write(chunk)
+                    local += n
+                if unsaved >= self.JOURNAL_EVERY:
+                    f.flush()
+                    self._journal["partial"] = {"file": file, "remote": remote, "local": local, "cr": held_cr}
+                    self._save_journal()
+                    unsaved = 0
+                await asyncio.sleep_ms(0)
+            if held_cr:
+                h.update(b"\r")
+                f.write(b"\r")
+        return binascii.hexlify(h.digest()).decode()
+
+    #--------------------------------------------------------------------------#
+    def _load_journal(self):
+        # Journal of a previous attempt is only valid for the same remote version
+        try:
+            with open(self.journal_file) as f:
+                journal = json.load(f)
+        except:
+            journal = {}
+        if journal.get("version") != self.remote_version:
+            journal = {"version": self.remote_version, "done": {}, "partial": None}
+        self._journal = journal
+
+    #--------------------------------------------------------------------------#
+    def _save_journal(self):
+        try:
+            with open(self.journal_file, "w") as f:
+                json.dump(self._journal, f)
+        except Exception as e:
+            logger.warn("OTA: Could not write journal: %s", e)
+
+    #--------------------------------------------------------------------------#
+    def _file_size(self, path):
+        try:
+            return os.stat(path)[6]
+        except OSError:
+            return -1
+
+    #--------------------------------------------------------------------------#
+    def _load_manifest(self, manifest):
+        self.remote_version = manifest.get("version", "")
+        files_meta = manifest.get("files", {})
+        self.hashes = {k: v["sha256"] for k, v in files_meta.items()}
+        self.sizes = {k: v["size"] for k, v in files_meta.items()}
+        self.bundle = manifest.get("bundle")
+        self._select_mpy(manifest.get("mpy"))
+
+    #--------------------------------------------------------------------------#
+    def _select_mpy(self, mpy):
+        """Swap lib sources for their precompiled .mpy when this VM can load them.
+
+        Import prefers a .py over an .mpy of the same name, so each selected
+        .mpy drops its .py from the manifest; the delta then removes it. A
+        flat rollback restores the .py, which again shadows the leftover .mpy.
+        """
+        self.mpy_dir = None
+        if not mpy or not self.use_mpy:
+            return
+        if mpy.get("version") != _mpy_version():
+            logger.info("OTA: Installing sources (manifest .mpy v%s, device v%s)", mpy.get("version"), _mpy_version())
+            return
+        self.mpy_dir = mpy.get("dir", "mpy")
+        for f, meta in mpy.get("files", {}).items():
+            src = f[:-4] + ".py"
+            self.hashes.pop(src, None)
+            self.sizes.pop(src, None)
+            self.hashes[f] = meta["sha256"]
+            self.sizes[f] = meta["size"]
+
+    #--------------------------------------------------------------------------#
+    def _manifest_dict(self):
+        # Rebuild the manifest from the compact state for staging on flash. Files
+        # are the selected set (.mpy in place of sources): what gets installed.
+        manifest = {"version": self.remote_version,
+                    "files": {k: {"sha256": h, "size": self.sizes.get(k, 0)} for k, h in self.hashes.items()}}
+        if self.bundle:
+            manifest["bundle"] = self.bundle
+        return manifest
+
+    #--------------------------------------------------------------------------#
+    async def release(self):
+        """Close the session and drop manifest state, buffers and caches so the heap can reclaim them."""
+        await self._close_session()
+        self.hashes = {}
+        self.sizes = {}
+        self.bundle = None
+        self.mpy_dir = None
+        self.changed = []
+        self.removed = []
+        self._buf = None
+        self._journal = None
+        self._cache = None
+
+    #--------------------------------------------------------------------------#
+    def _load_local_hashes(self):
+        try:
+            with open(self.local_manifest) as f:
+                files_meta = json.load(f).get("files", {})
+            return {k: v["sha256"] for k, v in files_meta.items()}
+        except Exception as e:
+            logger.debug("No usable local manifest: %s", e)
+            return {}
+
+    #--------------------------------------------------------------------------#
+    def _installed_size(self, file):
+        try:
+            return os.stat(f"{self.root}/{file}")[6]
+        except OSError:
+            return 0
+
+    #--------------------------------------------------------------------------#
+    def _compute_delta(self):
+        """Split the remote manifest into files that differ locally and files that are gone."""
+        local_hashes = self._load_local_hashes()
+        self.changed = []
+        for f in self.hashes:
+            if f in self.user_excluded:
+                continue
+            local = local_hashes.get(f)
+            if local is None:
+                try:
+                    local = self._sha256(f"{self.root}/{f}")
+                except OSError:
+                    pass
+            if local != self.hashes[f]:
+                self.changed.append(f)
+        self.removed = [f for f in local_hashes if f not in self.hashes and f not in self.user_excluded]
+        logger.info("OTA delta → %d changed, %d removed, %d total", len(self.changed), len(self.removed), len(self.hashes))
+
+    #--------------------------------------------------------------------------#
+    def _get_session(self):
+        # One keep-alive session spans the manifest fetch and every file fetch
+        if self._session is None:
+            self._session = http_client.Session()
+        return self._session
+
+    #--------------------------------------------------------------------------#
+    async def _close_session(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    #--------------------------------------------------------------------------#
+    def _load_cache(self):
+        if self._cache is None:
+            try:
+                with open(self.cache_file) as f:
+                    self._cache = json.load(f)
+            except:
+                self._cache = {}
+        return self._cache
+
+    #--------------------------------------------------------------------------#
+    def _save_cache(self, headers):
+        cache = {
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "version": self.remote_version,
+        }
+        if cache == self._load_cache():
+            return
+        self._cache = cache
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump(cache, f)
+        except Exception as e:
+            logger.warn("OTA: Could not save manifest cache: %s", e)
+
+    #--------------------------------------------------------------------------#
+    def _conditional_headers(self, local):
+        # A 304 is only useful if we can still answer without the body: either the
+        # manifest is in memory, or the cached one was for the version we run.
+        cache = self._load_cache()
+        if not self.remote_version and cache.get("version") != local:
+            return None
+        headers = {}
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        if cache.get("last_modified"):
+            headers["If-Modified-Since"] = cache["last_modified"]
+        return headers or None
+
     #--------------------------------------------------------------------------#
     async def check_for_update(self):
+        """Fetch the remote manifest; the session stays open only if an update follows.
+
+        Returns True when an update is available, False when the remote matches
+        the local version and None when the manifest could not be fetched.
+        """
+        result = None
         try:
-            r = requests.get(self.manifest_url)
-            self.manifest = r.json()
-            self.remote_version = self.manifest.get("version", "")
-            files_meta = self.manifest.get("files", {})
-            self.hashes = {k: v["sha256"] for k, v in files_meta.items()}
-            self.sizes = {k: v["size"] for k, v in files_meta.items()}
-            self.files = list(self.hashes.keys())
             local = await self._get_local_version()
-            logger.info(f"OTA → Local: {local} | Remote: {self.remote_version}")
-            return self.remote_version and self.remote_version != local
+            headers = self._conditional_headers(local)
+            r = await self._get_session().get(self.manifest_url, headers=headers)
+            try:
+                if r.status == 200:
+                    with memtel.phase("manifest"):
+                        self._load_manifest(await r.json())
+                    self._save_cache(r.headers)
+                elif r.status != 304:
+                    raise OSError(f"HTTP {r.status}")
+            finally:
+                await r.close()
+            if r.status == 304 and not self.remote_version:
+                logger.info("OTA → Local: %s | Remote: not modified", local)
+            else:
+                logger.info("OTA → Local: %s | Remote: %s", local, self.remote_version)
+                if self.remote_version and self.remote_version != local:
+                    self._compute_delta()
+                    return True
+            result = False
         except Exception as e:
-            logger.error(f"OTA: Failed to fetch manifest: {e}")
-            return False
+            logger.error("OTA: Failed to fetch manifest: %s", e)
+        await self._close_session()
+        return result
     
     #--------------------------------------------------------------------------#
     async def download_update(self):
+        try:
+            with memtel.phase("download"):
+                return await self._download_changed()
+        finally:
+            await self._close_session()
+
+    #--------------------------------------------------------------------------#
+    async def _download_changed(self):
+        session = self._get_session()
         try:
             os.mkdir(self.ota_dir)
-            logger.info(f"Created OTA directory: {self.ota_dir}")
+            logger.info("Created OTA directory: %s", self.ota_dir)
         except:
-            logger.debug(f"OTA directory already exists: {self.ota_dir}")
+            logger.debug("OTA directory already exists: %s", self.ota_dir)
 
-        total = len(self.files)
-        for i, file in enumerate(self.files):
-            url = f"{self.repo_url}/{file}"
-            dest = f"{self.ota_dir}/{file}"
-            await self._ensure_dirs(dest)
-            self.current_file = file
+        self._load_journal()
+        if self.layout == "ab":
+            await self._prepare_slot()
+        if self._use_bundle():
+            ok = await self._download_bundle(session)
+        else:
+            ok = await self._download_files(session)
+        if not ok:
+            return False
+
+        try:
+            with open(f"{self.ota_dir}/manifest.json", "w") as f:
+                json.dump(self._manifest_dict(), f)
+            with open(f"{self.ota_dir}/delta.json", "w") as f:
+                json.dump({"changed": self.changed, "removed": self.removed}, f)
+            logger.debug("Saved manifest.json and delta.json to OTA directory")
+        except Exception as e:
+            logger.error("Failed to save manifest.json: %s", e)
+            return False
+
+        self.progress = 100
+        return True
+
+    #--------------------------------------------------------------------------#
+    async def _prepare_slot(self):
+        """Seed the inactive slot with unchanged files so only the delta is fetched."""
+        try:
+            with open(f"{self.ota_dir}/manifest.json") as f:
+                files_meta = json.load(f).get("files", {})
+            slot_hashes = {k: v["sha256"] for k, v in files_meta.items()}
+        except:
+            slot_hashes = {}
+        # The slot manifest only vouches for the slot while nothing in it changes;
+        # drop it before the first write so an interrupted attempt cannot leave
+        # stale entries for a later version to trust
+        try:
+            os.remove(f"{self.ota_dir}/manifest.json")
+        except OSError:
+            pass
+
+        fetch = []
+        for f in self.hashes:
+            if f in self.user_excluded:
+                continue
+            dst = f"{self.ota_dir}/{f}"
+            if slot_hashes.get(f) == self.hashes[f] and self._file_size(dst) >= 0:
+                continue  # Slot still holds this exact file from an earlier version
+            if f in self.changed:
+                fetch.append(f)
+                continue
+            await self._ensure_dirs(dst)
+            await self._copy_file(f"{self.root}/{f}", dst, self.hashes[f])
+            self._journal["done"][f] = self.hashes[f]
+            if __debug__:
+                logger.debug("Seeded slot with: %s", f)
+
+        for f in list(self._walk(self.ota_dir)):
+            if f not in self.hashes and f not in SLOT_STAGING and f != "manifest.json":
+                os.remove(f"{self.ota_dir}/{f}")
+                if __debug__:
+                    logger.debug("Removed from slot: %s", f)
+        self._save_journal()
+        self.changed = fetch
+
+    #--------------------------------------------------------------------------#
+    async def _fetch(self, session, file, dest, expected_hash, normalize):
+        """Download one repo file into dest, resuming from the journal when possible."""
+        path = f"{self.mpy_dir}/{file}" if self.mpy_dir and file.endswith(".mpy") else file
+        url = f"{self.repo_url}/{path}"
+        resume = None
+        partial = self._journal.get("partial")
+        if partial and partial["file"] == file and self._file_size(dest) >= partial["local"]:
+            resume = (partial["remote"], partial["local"], partial["cr"])
+        try:
+            logger.info("Downloading: %s → %s", file, url)
+            headers = {"Range": f"bytes={resume[0]}-"} if resume else None
+            r = await session.get(url, headers=headers)
             try:
-                logger.info(f"Downloading: {file} → {url}")
-                r = requests.get(url)
-                content = r.content
-                if self._should_normalize(file):
-                    content = content.replace(b"\r\n", b"\n")
-                    logger.debug(f"Normalized line endings for {file}")
-                with open(dest, "wb") as f:
-                    f.write(content)
-                actual_hash = self._sha256(dest)
-                expected_hash = self.hashes[file]
-                if actual_hash != expected_hash:
-                    logger.error(f"Hash mismatch: {file}")
+                if resume and r.status == 206:
+                    logger.info("Resuming %s at byte %d", file, resume[0])
+                elif r.status == 200:
+                    resume = None  # Server sent the whole body
+                else:
+                    logger.error("HTTP %d for %s", r.status, file)
+                    self._journal["partial"] = None
+                    self._save_journal()
                     return False
-                logger.info(f"Downloaded {file} ✓")
-                self.progress = int(((i + 1) / total) * 100)
-                await asyncio.sleep_ms(10)
-            except Exception as e:
-                logger.error(f"Download failed: {file}: {e}")
+                actual_hash = await self._stream_to_file(r, file, dest, normalize, resume)
+            finally:
+                await r.close()
+            if actual_hash != expected_hash:
+                logger.error("Hash mismatch: %s", file)
+                self._journal["done"].pop(file, None)
+                self._journal["partial"] = None
+                self._save_journal()
                 return False
+            self._journal["done"][file] = actual_hash
+            self._journal["partial"] = None
+            self._save_journal()
+            logger.info("Downloaded %s ✓", file)
+            return True
+        except Exception as e:
+            logger.error("Download failed: %s: %s", file, e)
+            return False
+
+    #--------------------------------------------------------------------------#
+    async def _download_files(self, session):
+        done = self._journal["done"]
+        total = len(self.changed)
+        for i, file in enumerate(self.changed):
+            dest = f"{self.ota_dir}/{file}"
+            self.current_file = file
+            expected_hash = self.hashes[file]
+            if done.get(file) == expected_hash and self._file_size(dest) >= 0:
+                logger.info("Already downloaded %s ✓", file)
+            else:
+                await self._ensure_dirs(dest)
+                if not await self._fetch(session, file, dest, expected_hash, self._should_normalize(file)):
+                    return False
+                memtel.sample(note=file)
+            self.progress = int(((i + 1) / total) * 100)
+            await asyncio.sleep_ms(10)
+        return True
+
+    #--------------------------------------------------------------------------#
+    def _use_bundle(self):
+        # The bundle carries every file, so it only pays off when it is smaller
+        # than the individual files this delta would fetch
+        bundle = self.bundle
+        if not bundle or len(self.changed) < 2:
+            return False
+        return bundle["size"] < sum(self.sizes.get(f, 0) for f in self.changed)
+
+    #--------------------------------------------------------------------------#
+    async def _download_bundle(self, session):
+        bundle = self.bundle
+        name = bundle["path"]
+        staged = f"{self.ota_dir}/{BUNDLE_STAGING}"
+        self.current_file = name
+        if self._journal["done"].get(name) == bundle["sha256"] and self._file_size(staged) >= 0:
+            logger.info("Already downloaded %s ✓", name)
+        elif not await self._fetch(session, name, staged, bundle["sha256"], False):
+            return False
+        return await self._unpack_bundle(staged)
 
+    #--------------------------------------------------------------------------#
+    async def _unpack_bundle(self, path):
+        """Inflate a verified bundle into the OTA directory, hashing each wanted file."""
+        wanted = set(self.changed)
+        done = self._journal["done"]
+        buf = self._get_buffer()
+        mv = memoryview(buf)
+        extracted = 0
         try:
-            with open(f"{self.ota_dir}/manifest.json", "w") as f:
-                json.dump(self.manifest, f)
-            logger.debug("Saved manifest.json to OTA directory")
+            with open(path, "rb") as raw:
+                z = _inflater(raw)
+                if _read_exact(z, len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                    raise ValueError("Not an OTA bundle")
+                while True:
+                    n = struct.unpack(">H", _read_exact(z, 2))[0]
+                    if not n:
+                        break
+                    file = _read_exact(z, n).decode()
+                    left = struct.unpack(">I", _read_exact(z, 4))[0]
+                    out = None
+                    if file in wanted:
+                        self.current_file = file
+                        dest = f"{self.ota_dir}/{file}"
+                        await self._ensure_dirs(dest)
+                        out = open(dest, "wb")
+                        h = hashlib.sha256()
+                    try:
+                        while left:
+                            k = z.readinto(mv[:min(left, len(buf))])
+                            if not k:
+                                raise ValueError("Truncated bundle")
+                            if out:
+                                h.update(mv[:k])
+                                out.write(mv[:k])
+                            left -= k
+                            await asyncio.sleep_ms(0)
+                    finally:
+                        if out:
+                            out.close()
+                    if out:
+                        actual_hash = binascii.hexlify(h.digest()).decode()
+                        if actual_hash != self.hashes[file]:
+                            logger.error("Hash mismatch in bundle: %s", file)
+                            return False
+                        done[file] = actual_hash
+                        memtel.sample(note=file)
+                        extracted += 1
+                        self.progress = int(extracted / len(wanted) * 100)
+                        logger.info("Unpacked %s ✓", file)
         except Exception as e:
-            logger.error(f"Failed to save manifest.json: {e}")
+            logger.error("Bundle unpack failed: %s", e)
             return False
 
+        if extracted != len(wanted):
+            logger.error("Bundle is missing %d changed file(s)", len(wanted) - extracted)
+            return False
+        self._save_journal()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
         return True
     
+    #--------------------------------------------------------------------------#
+    async def _backup(self, f):
+        src = f"/{f}"
+        bkp = f"{self.backup_dir}/{f}"
+        await self._ensure_dirs(bkp)
+        try:
+            os.stat(src)
+            await self._copy_file(src, bkp)
+            if __debug__:
+                logger.debug("Backed up: %s", f)
+        except OSError:
+            logger.warn("Source file missing, skipping backup: %s", src)
+        except Exception as e:
+            logger.warn("Could not backup %s: %s", f, e)
+
     #--------------------------------------------------------------------------#
     async def apply_update(self):
+        with memtel.phase("apply"):
+            if self.layout == "ab":
+                return await self._apply_slot()
+            return await self._apply_flat()
+
+    #--------------------------------------------------------------------------#
+    async def _apply_flat(self):
         try:
             with open(f"{self.ota_dir}/manifest.json") as f:
-                self.manifest = json.load(f)
-            self.remote_version = self.manifest.get("version", "")
-            files_meta = self.manifest.get("files", {})
-            self.hashes = {k: v["sha256"] for k, v in files_meta.items()}
-            self.sizes = {k: v["size"] for k, v in files_meta.items()}
-            self.files = list(self.hashes.keys())
+                self._load_manifest(json.load(f))
             if not self.remote_version:
-                logger.error(f"OTA: Manifest missing version field → {self.manifest}")
+                logger.error("OTA: Manifest missing version field: %s/manifest.json", self.ota_dir)
                 return False
         except Exception as e:
-            logger.error(f"OTA: Failed to load manifest during apply: {e}")
+            logger.error("OTA: Failed to load manifest during apply: %s", e)
             return False
 
+        try:
+            with open(f"{self.ota_dir}/delta.json") as f:
+                delta = json.load(f)
+            self.changed = delta.get("changed", [])
+            self.removed = delta.get("removed", [])
+        except Exception:
+            logger.warn("OTA: No delta.json in OTA directory, applying full manifest")
+            self.changed = [f for f in self.hashes if f not in self.user_excluded]
+            self.removed = []
+
+        # Start from an empty backup so rollback restores exactly this update
+        try:
+            self._rmtree(self.backup_dir)
+            logger.debug("Cleared backup directory: %s", self.backup_dir)
+        except OSError:
+            pass
         try:
             os.mkdir(self.backup_dir)
-            logger.info(f"Created backup directory: {self.backup_dir}")
+            logger.info("Created backup directory: %s", self.backup_dir)
         except:
-            logger.debug(f"Backup directory already exists: {self.backup_dir}")
+            logger.debug("Backup directory already exists: %s", self.backup_dir)
 
-        for f in self.files:
+        await self._backup("manifest.json")
+        verified = {}  # Files known to match the manifest, for the integrity index
+        for f in self.changed:
             if f in self.user_excluded:
-                logger.info(f"⚠️ Skipping OTA apply for user-preserved file: {f}")
+                logger.info("⚠️ Skipping OTA apply for user-preserved file: %s", f)
                 continue
             src = f"/{f}"
-            bkp = f"{self.backup_dir}/{f}"
             new = f"{self.ota_dir}/{f}"
-            await self._ensure_dirs(bkp)
             try:
-                os.stat(src)
-                with open(src, "rb") as r, open(bkp, "wb") as w:
-                    w.write(r.read())
-                logger.debug(f"Backed up: {f}")
+                current = self._sha256(src)
             except OSError:
-                logger.warn(f"Source file missing, skipping backup: {src}")
-            except Exception as e:
-                logger.warn(f"Could not backup {f}: {e}")
+                current = None
+            if current == self.hashes[f]:
+                if __debug__:
+                    logger.debug("Already current, skipping backup and apply: %s", f)
+                verified[f] = current
+                continue
+            await self._backup(f)
             try:
                 await self._ensure_dirs(src)
-                with open(new, "rb") as r, open(src, "wb") as w:
-                    w.write(r.read())
-                logger.info(f"Applied: {f}")
+                await self._copy_file(new, src, self.hashes[f])
+                logger.info("Applied: %s", f)
+                verified[f] = self.hashes[f]
+                memtel.sample(note=f)
             except Exception as e:
-                logger.error(f"Failed to apply {f}: {e}")
+                logger.error("Failed to apply %s: %s", f, e)
                 await self.rollback()
                 return False
 
+        for f in self.removed:
+            await self._backup(f)
+            try:
+                os.remove(f"/{f}")
+                logger.info("Removed: %s", f)
+            except OSError:
+                if __debug__:
+                    logger.debug("Already absent: %s", f)
+
         try:
             with open(self.version_file, "w") as f:
                 f.write(self.remote_version)
-            logger.info(f"Version updated to {self.remote_version}")
+            logger.info("Version updated to %s", self.remote_version)
         except Exception as e:
-            logger.warn(f"Failed to write version file: {e}")
+            logger.warn("Failed to write version file: %s", e)
 
         try:
             with open(f"{self.ota_dir}/manifest.json") as src:
                 manifest_data = json.load(src)
-            with open("/manifest.json", "w") as dst:
+            with open(self.local_manifest, "w") as dst:
                 dst.write(json.dumps(manifest_data))
             logger.info("📄 manifest.json copied and formatted at root")
-            with open("/version.txt") as f:
+            with open(self.version_file) as f:
                 version_txt = f.read().strip()
             manifest_version = manifest_data.get("version", "")
             if manifest_version != version_txt:
-                logger.warn(f"⚠️ Version mismatch: manifest={manifest_version}, version.txt={version_txt}")
+                logger.warn("⚠️ Version mismatch: manifest=%s, version.txt=%s", manifest_version, version_txt)
         except Exception as e:
-            logger.warn(f"Could not write or verify manifest.json: {e}")
+            logger.warn("Could not write or verify manifest.json: %s", e)
 
+        self._record_integrity(verified, "")
         await self.cleanup()
 
+        self._mark_commit_pending()
+        return True
+
+    #--------------------------------------------------------------------------#
+    def _record_integrity(self, verified, root):
+        # Seed the integrity index so the commit check need not re-hash what was just verified
+        try:
+            integrity.record(verified, root)
+        except Exception as e:
+            logger.warn("Could not update integrity index: %s", e)
+
+    #--------------------------------------------------------------------------#
+    def _mark_commit_pending(self):
         try:
-            os.rename("ota_pending.flag", "ota_commit_pending.flag")
+            os.rename(PENDING_FLAG, COMMIT_FLAG)
             logger.info("📛 Renamed ota_pending.flag → ota_commit_pending.flag")
         except Exception as e:
-            logger.warn(f"Could not rename ota_pending.flag: {e}")
+            logger.warn("Could not rename ota_pending.flag: %s", e)
 
+    #--------------------------------------------------------------------------#
+    async def _apply_slot(self):
+        """A/B apply: the inactive slot is already complete, so just repoint boot at it."""
+        slot = self.ota_dir
+        try:
+            with open(f"{slot}/manifest.json") as f:
+                self._load_manifest(json.load(f))
+            if not self.remote_version:
+                logger.error("OTA: Slot manifest missing version field: %s", slot)
+                return False
+        except Exception as e:
+            logger.error("OTA: Failed to load slot manifest during apply: %s", e)
+            return False
+
+        # The journal lists what this cycle hashed: seeded, fetched or unpacked
+        # files. Files the slot already held were skipped unread and are left
+        # for the commit check to verify.
+        self._load_journal()
+        verified = {f: h for f, h in self._journal["done"].items()
+                    if self.hashes.get(f) == h and f not in self.user_excluded}
+        self._journal = None
+        for name in SLOT_STAGING:
+            try:
+                os.remove(f"{slot}/{name}")
+            except OSError:
+                pass
+        self._record_integrity(verified, slot)
+
+        try:
+            _write_pointer({"active": slot[1:], "previous": self.root[1:]})
+            logger.info("🔀 Active slot → %s (version %s)", slot[1:], self.remote_version)
+        except Exception as e:
+            logger.error("OTA: Failed to switch slot pointer: %s", e)
+            return False
+
+        self._mark_commit_pending()
         return True
     
+    #--------------------------------------------------------------------------#
+    def _walk(self, path, prefix=""):
+        for item in os.listdir(path):
+            full_path = f"{path}/{item}"
+            rel = f"{prefix}{item}"
+            if os.stat(full_path)[0] & 0x4000:
+                yield from self._walk(full_path, f"{rel}/")
+            else:
+                yield rel
+
     #--------------------------------------------------------------------------#
     async def rollback(self):
-        for f in self.files:
+        with memtel.phase("rollback"):
+            if self.layout == "ab":
+                self._rollback_slot()
+            else:
+                await self._restore_backup()
+
+        for flag in (PENDING_FLAG, COMMIT_FLAG):
+            try:
+                os.remove(flag)
+                logger.info("🗑 %s removed after rollback", flag[1:])
+            except OSError:
+                pass
+
+        logger.info("✅ Rollback complete. Previous firmware restored.")
+
+    #--------------------------------------------------------------------------#
+    def _rollback_slot(self):
+        # Only a trial boot of a freshly switched slot has anything to revert;
+        # an apply that failed before the switch left the pointer untouched.
+        try:
+            os.stat(COMMIT_FLAG)
+        except OSError:
+            logger.info("No uncommitted slot switch to roll back")
+            return
+        pointer = _read_pointer()
+        previous = pointer.get("previous")
+        try:
+            if previous in SLOTS:
+                _write_pointer({"active": previous, "previous": pointer.get("active")})
+            else:
+                os.remove(SLOT_POINTER)
+            logger.info("🔀 Active slot → %s", previous or "flash root")
+        except Exception as e:
+            logger.error("Rollback failed to switch slot pointer: %s", e)
+
+    #--------------------------------------------------------------------------#
+    async def _restore_backup(self):
+        # Restore whatever the last apply backed up; that is exactly what it touched
+        try:
+            backed_up = list(self._walk(self.backup_dir))
+        except OSError:
+            logger.warn("No backup directory to roll back from: %s", self.backup_dir)
+            backed_up = []
+
+        for f in backed_up:
             if f in self.user_excluded:
-                logger.info(f"⚠️ Skipping rollback for user-preserved file: {f}")
+                logger.info("⚠️ Skipping rollback for user-preserved file: %s", f)
                 continue
             bkp = f"{self.backup_dir}/{f}"
             dst = f"/{f}"
             try:
-                with open(bkp, "rb") as r, open(dst, "wb") as w:
-                    w.write(r.read())
-                logger.info(f"Rollback: {f}")
+                await self._ensure_dirs(dst)
+                await self._copy_file(bkp, dst)
+                logger.info("Rollback: %s", f)
             except Exception as e:
-                logger.error(f"Rollback failed: {f}: {e}")
-
-        try:
-            if "ota_pending.flag" in os.listdir("/"):
-                os.remove("ota_pending.flag")
-                logger.info("🗑 ota_pending.flag removed after rollback")
-        except Exception as e:
-            logger.warn(f"Could not remove ota_pending.flag during rollback: {e}")
-
-        logger.info("✅ Rollback complete. Previous firmware restored.")
+                logger.error("Rollback failed: %s: %s", f, e)
     
     #--------------------------------------------------------------------------#
     def _rmtree(self, path):
@@ -248,7 +945,7 @@ class OTAUpdater:
                 else:
                     os.remove(full_path)
             except Exception as e:
-                logger.warn(f"Could not remove {full_path}: {e}")
+                logger.warn("Could not remove %s: %s", full_path, e)
                 
     #--------------------------------------------------------------------------#
     async def cleanup(self):
@@ -257,8 +954,18 @@ class OTAUpdater:
             os.rmdir(self.ota_dir)
             logger.info("Cleaned up OTA directory")
         except Exception as e:
-            logger.warn(f"Failed to clean up OTA directory: {e}")
+            logger.warn("Failed to clean up OTA directory: %s", e)
             
     #--------------------------------------------------------------------------#
     def get_required_flash_bytes(self):
-        return sum(self.sizes.get(f, 0) for f in self.files) * 2
\ No newline at end of file
+        if self.layout == "ab":
+            # The inactive slot is rewritten in place; only growth needs new space
+            return sum(max(0, self.sizes.get(f, 0) - max(0, self._file_size(f"{self.ota_dir}/{f}")))
+                       for f in self.hashes if f not in self.user_excluded)
+        # Staged new files + backups of the files they replace + net growth on apply
+        total = 0
+        for f in self.changed:
+            new = self.sizes.get(f, 0)
+            old = self._installed_size(f)
+            total += new + old + max(0, new - old)
+        return total
\ No newline at end of file
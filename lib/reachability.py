@@ -0,0 +1,141 @@
+# reachability.py
+
+import socket
+import time
+import uasyncio as asyncio
+from backoff import Backoff
+
+RESOLVE_MIN_MS = 30 * 1000        # First re-resolve attempt while offline without an address
+RESOLVE_MAX_MS = 10 * 60 * 1000   # Ceiling for later attempts
+
+
+class Reachability:
+    """ Tracks whether the Internet is reachable without probing on a fixed timer.
+
+    Any successful outbound traffic (http_client calls mark_success for every
+    response) counts as proof of connectivity. An active probe is only due
+    once the last proof is older than the current interval, which doubles
+    while things are stable (up to max_s) and drops back to min_s after a
+    failure. Probe methods, cheapest first:
+        "dns"  — resolve the target host (no packets beyond the DNS query)
+        "tcp"  — open and close a TCP connection to host:port
+        "http" — GET http://<target>/generate_204
+
+    getaddrinfo() is synchronous and wait_for cannot bound it, so a lookup
+    with the upstream down blocks the whole loop for lwIP's DNS timeout.
+    "tcp" therefore probes a cached address. It resolves freely while online
+    or right after a Wi-Fi join, but while offline without an address only on
+    a backed-off schedule (RESOLVE_MIN_MS up to RESOLVE_MAX_MS), so an outage
+    costs an occasional stall rather than one per probe. The cache is dropped
+    when traffic proves the link is back after a failure, or when the target
+    changes. "dns" and "http" resolve on every probe and can block the loop;
+    prefer them only with an IP target.
+    """
+
+    def __init__(self, method="tcp", target="clients3.google.com:80", min_s=5, max_s=300, timeout=3):
+        self.online = None  # None until the first proof or failed probe
+        self.last_ok_ms = None
+        self.probes = 0
+        self.failures = 0
+        self.host = None
+        self._addr = None  # Resolved host for "tcp" probes
+        self._resolve = Backoff(RESOLVE_MIN_MS, RESOLVE_MAX_MS, jitter=0.1)
+        self._resolve_due = time.ticks_ms()
+        self.configure(method, target, min_s, max_s, timeout)
+
+    def configure(self, method="tcp", target="clients3.google.com:80", min_s=5, max_s=300, timeout=3):
+        if method not in ("dns", "tcp", "http"):
+            raise ValueError(f"Unknown probe method: {method}")
+        self.method = method
+        host, _, port = target.partition(":")
+        if host != self.host:
+            self.host = host
+            self.forget_address()
+        self.port = int(port) if port else 80
+        self.timeout = timeout
+        self._interval = Backoff(min_s * 1000, max_s * 1000, jitter=0.1)
+        self._due = time.ticks_ms()
+
+    def mark_success(self):
+        """ Record proof of connectivity and push the next probe out """
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self._due) >= 0 or not self.online:
+            # Grow the interval once per period, not once per response
+            self._due = time.ticks_add(now, self._interval.next_ms())
+        self.online = True
+        self.last_ok_ms = now
+
+    def mark_failure(self):
+        self.online = False
+        self.failures += 1
+        self._interval.reset()
+        self._due = time.ticks_add(time.ticks_ms(), self._interval.base_ms)
+
+    def mark_down(self):
+        """ Link is down (e.g. Wi-Fi lost): offline now, probe as soon as it returns """
+        self.online = False
+        self._interval.reset()
+        self._due = time.ticks_ms()
+
+    def mark_joined(self):
+        """ Wi-Fi just joined: DNS is most likely reachable, so allow a resolve now """
+        self._resolve.reset()
+        self._resolve_due = time.ticks_ms()
+
+    def is_stale(self):
+        return self.online is None or time.ticks_diff(time.ticks_ms(), self._due) >= 0
+
+    def forget_address(self):
+        self._addr = None
+        self._resolve_due = time.ticks_ms()
+
+    async def _probe_once(self):
+        if self.method == "dns":
+            socket.getaddrinfo(self.host, self.port)  # Blocking (see class docstring)
+        elif self.method == "tcp":
+            if self._addr is None:
+                now = time.ticks_ms()
+                if self.online is False and time.ticks_diff(now, self._resolve_due) < 0:
+                    raise OSError("Target not resolved and offline")  # Resolving now could block the loop
+                self._resolve_due = time.ticks_add(now, self._resolve.next_ms())
+                self._addr = socket.getaddrinfo(self.host, self.port)[0][-1][0]
+                self._resolve.reset()
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self._addr, self.port), self.timeout)
+            writer.close()
+            await writer.wait_closed()
+        else:
+            import http_client
+            r = await http_client.get(f"http://{self.host}:{self.port}/generate_204", timeout=self.timeout)
+            await r.close()
+
+    async def probe(self):
+        """ Run one active probe now; returns True when reachable """
+        self.probes += 1
+        try:
+            await self._probe_once()
+        except Exception:
+            self.mark_failure()
+            return False
+        self.mark_success()
+        return True
+
+    async def check(self):
+        """ Probe only if the state is stale; returns the current reachability """
+        if self.is_stale():
+            return await self.probe()
+        return self.online
+
+    def status(self):
+        age = None if self.last_ok_ms is None else time.ticks_diff(time.ticks_ms(), self.last_ok_ms)
+        return {"online": self.online, "last_ok_age_ms": age, "method": self.method,
+                "probes": self.probes, "failures": self.failures}
+
+
+tracker = Reachability()
+
+
+def mark_success():
+    """ Traffic proof from other modules (http_client) """
+    if tracker.online is False:
+        tracker.forget_address()  # Recovered: re-resolve while online in case the target moved
+    tracker.mark_success()
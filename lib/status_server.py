@@ -0,0 +1,109 @@
+# status_server.py
+
+import uasyncio as asyncio
+import json
+
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+class StatusServer:
+    """ Read-only JSON status endpoint served from the event loop.
+
+    Sections are registered with add(name, fn); fn() must return something
+    json can encode and is only called when a client asks for it.
+
+        GET /status          every section in one object
+        GET /status/<name>   one section
+        GET /log?n=20        tail of the device log
+
+    At most max_clients connections are served at once; extra ones get a
+    503 and are closed straight away, so a fleet scraper cannot pile up
+    sockets or heap on the device. Request headers are read and discarded
+    line by line and nothing is kept between requests.
+    """
+
+    def __init__(self, port=80, max_clients=2, timeout=5):
+        self.port = port
+        self.max_clients = max_clients
+        self.timeout = timeout
+        self._sections = {}
+        self._active = 0
+        self._server = None
+        self.served = 0
+        self.rejected = 0
+
+    def add(self, name, fn):
+        """ Register a status section """
+        self._sections[name] = fn
+
+    async def start(self):
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, "0.0.0.0", self.port)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        if self._active >= self.max_clients:
+            self.rejected += 1
+            await self._close(writer, 503, b'{"error":"busy"}')
+            return
+        self._active += 1
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            while True:  # Discard headers without keeping them
+                h = await asyncio.wait_for(reader.readline(), self.timeout)
+                if h in (b"\r\n", b"\n", b""):
+                    break
+            parts = line.split()
+            if len(parts) < 2 or parts[0] != b"GET":
+                await self._close(writer, 400, b'{"error":"GET only"}')
+                return
+            status, body = self._route(parts[1].decode())
+            self.served += 1
+            await self._close(writer, status, body)
+        except Exception:
+            await self._close(writer)
+        finally:
+            self._active -= 1
+
+    def _route(self, target):
+        path, _, query = target.partition("?")
+        try:
+            if path in ("/", "/status"):
+                return 200, json.dumps({name: fn() for name, fn in self._sections.items()})
+            if path.startswith("/status/"):
+                fn = self._sections.get(path[8:])
+                if fn is None:
+                    return 404, '{"error":"no such section"}'
+                return 200, json.dumps(fn())
+            if path == "/log":
+                import logger
+                n = 20
+                for arg in query.split("&"):
+                    if arg.startswith("n="):
+                        n = max(1, min(200, int(arg[2:])))
+                return 200, json.dumps(logger.tail(n))
+        except Exception as e:
+            return 503, json.dumps({"error": str(e)})
+        return 404, '{"error":"not found"}'
+
+    async def _close(self, writer, status=None, body=None):
+        try:
+            if status is not None:
+                if isinstance(body, str):
+                    body = body.encode()
+                writer.write(("HTTP/1.0 %d %s\r\nContent-Type: application/json\r\n"
+                              "Content-Length: %d\r\nConnection: close\r\n\r\n"
+                              % (status, _STATUS_TEXT[status], len(body))).encode())
+                writer.write(body)
+                await writer.drain()
+        except Exception:
+            pass
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
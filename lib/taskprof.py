@@ -0,0 +1,136 @@
+# taskprof.py
+#
+# Opt-in per-task profiler. enable() swaps asyncio.create_task for a wrapper
+# that times every resume of each new task with ticks_us; disable() puts the
+# original back. Tasks created while it is off are never wrapped, so the
+# profiler costs nothing unless it was enabled.
+
+import time
+import uasyncio as asyncio
+
+_orig_create_task = None
+_budget_us = 0
+_stats = {}      # name -> [resumes, total_us, max_us, slow_resumes]
+_slow = []       # Recent over-budget resumes: (ticks_ms, name, us)
+_SLOW_KEEP = 16
+_since = 0
+
+
+def _task_name(coro):
+    # MicroPython: "<generator object 'monitor_connection' at 20012340>"
+    # CPython:     "<coroutine object WiFiManager.monitor_connection at 0x...>"
+    s = str(coro)
+    i = s.find("object ")
+    if i < 0:
+        return s
+    name = s[i + 7:].split(" ")[0].strip("'")
+    return name.split(".")[-1]
+
+
+def _record(name, us):
+    st = _stats.get(name)
+    if st is None:
+        st = _stats[name] = [0, 0, 0, 0]
+    st[0] += 1
+    st[1] += us
+    if us > st[2]:
+        st[2] = us
+    if us > _budget_us:
+        st[3] += 1
+        _slow.append((time.ticks_ms(), name, us))
+        if len(_slow) > _SLOW_KEEP:
+            _slow.pop(0)
+
+
+def _profiled(coro, name):
+    # Drives coro one resume at a time, forwarding what the scheduler sends or throws
+    value, exc = None, None
+    while True:
+        t0 = time.ticks_us()
+        try:
+            if exc is None:
+                yielded = coro.send(value)
+            else:
+                yielded = coro.throw(exc)
+        except StopIteration as e:
+            _record(name, time.ticks_diff(time.ticks_us(), t0))
+            return e.value
+        except BaseException:
+            _record(name, time.ticks_diff(time.ticks_us(), t0))
+            raise
+        _record(name, time.ticks_diff(time.ticks_us(), t0))
+        try:
+            value, exc = (yield yielded), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:  # CancelledError, timeouts
+            value, exc = None, e
+
+
+def _create_task(coro, name=None):
+    return _orig_create_task(_profiled(coro, name or _task_name(coro)))
+
+
+def enable(budget_us=20000):
+    """ Profile tasks created from now on; resumes over budget_us are logged as slow """
+    global _orig_create_task, _budget_us, _since
+    _budget_us = budget_us
+    if _orig_create_task is None:
+        _orig_create_task = asyncio.create_task
+        asyncio.create_task = _create_task
+        _since = time.ticks_ms()
+
+
+def disable():
+    """ Stop wrapping new tasks (tasks already wrapped keep reporting) """
+    global _orig_create_task
+    if _orig_create_task is not None:
+        asyncio.create_task = _orig_create_task
+        _orig_create_task = None
+
+
+def enabled():
+    return _orig_create_task is not None
+
+
+def reset():
+    global _since
+    _stats.clear()
+    _slow.clear()
+    _since = time.ticks_ms()
+
+
+def stats():
+    """ {name: (resumes, total_us, max_us, slow_resumes)} """
+    return {name: tuple(st) for name, st in _stats.items()}
+
+
+def slow_resumes():
+    """ Recent over-budget resumes as (ticks_ms, name, us), oldest first """
+    return list(_slow)
+
+
+def table():
+    """ Compact text table, busiest task first """
+    elapsed_us = max(1, time.ticks_diff(time.ticks_ms(), _since)) * 1000
+    lines = ["%-24s %7s %9s %7s %7s %5s %4s" % ("task", "resumes", "total_ms", "avg_us", "max_us", "cpu%", "slow")]
+    for name, st in sorted(_stats.items(), key=lambda kv: -kv[1][1]):
+        resumes, total, peak, slow = st
+        lines.append("%-24s %7d %9d %7d %7d %5.1f %4d" % (
+            name[:24], resumes, total // 1000, total // max(1, resumes), peak,
+            100 * total / elapsed_us, slow))
+    for ticks, name, us in _slow:
+        lines.append("slow @%d ms: %s %d us (budget %d)" % (ticks, name, us, _budget_us))
+    return "\n".join(lines)
+
+
+def dump(path="/taskprof.txt"):
+    """ Write table() to flash for later inspection """
+    try:
+        with open(path, "w") as f:
+            f.write(table())
+            f.write("\n")
+        return True
+    except OSError:
+        return False
@@ -1,14 +1,29 @@
 import network
 import uasyncio as asyncio
-import socket
+import binascii
+import json
 import time
-import urequests
+import reachability
+from backoff import Backoff
 from logger import Logger  # Import logger module
 
+CACHE_FILE = "/wifi_cache.json"  # Last good BSSID, channel and IP config
+# Defaults for configure()
+POLL_MS = 50                     # wlan.status() polling interval while joining
+FAST_TIMEOUT_MS = 3000           # Budget for a join using the cached AP
+CONNECT_TIMEOUT_MS = 20000       # Budget for a full scan-and-join
+RETRY_MIN_MS = 2000              # Reconnect backoff while the AP is unreachable
+RETRY_MAX_MS = 5 * 60 * 1000
+LEARN_DELAY_MS = 15 * 1000       # Wait after going online before the one-off AP scan
+
+STAT_GOT_IP = getattr(network, "STAT_GOT_IP", 3)
+
 class WiFiManager:
-    def __init__(self, ssid: str, password: str):
+    def __init__(self, ssid: str, password: str, static_ip=None, reuse_lease=False):
         self.ssid = ssid
         self.password = password
+        self.static_ip = tuple(static_ip) if static_ip else None  # (ip, mask, gateway, dns)
+        self.reuse_lease = reuse_lease  # Reapply the cached DHCP lease instead of waiting for DHCP
         self.wlan = network.WLAN(network.STA_IF)
         self.wlan.active(True)
         self.internet_available = False  # Internet status flag
@@ -16,54 +31,177 @@ class WiFiManager:
         self.ip_address = None  # Store connected IP address
         self.wifi_status = "Disconnected"  # Track Wi-Fi status
         self.internet_status = "Disconnected"  # Track Internet status
+        self._lease_reused = False
+        self._learning = False
+        self.configure()
 
-    async def connect(self):
-        """ Connect to Wi-Fi with error handling and reconnection logic """
-        if not self.wlan.isconnected():
+    def configure(self, poll_ms=POLL_MS, fast_timeout_ms=FAST_TIMEOUT_MS, connect_timeout_ms=CONNECT_TIMEOUT_MS,
+                  retry_min_ms=RETRY_MIN_MS, retry_max_ms=RETRY_MAX_MS):
+        """ Set join timing and reconnect backoff; safe to call while running """
+        self.poll_ms = poll_ms
+        self.fast_timeout_ms = fast_timeout_ms
+        self.connect_timeout_ms = connect_timeout_ms
+        self._retry = Backoff(retry_min_ms, retry_max_ms)
+
+    def set_credentials(self, ssid, password):
+        """ Switch networks: drop the current link so the monitor rejoins with the new credentials """
+        if (ssid, password) == (self.ssid, self.password):
+            return
+        self.ssid = ssid
+        self.password = password
+        self.wlan.disconnect()
+
+    def _load_cache(self):
+        try:
+            with open(CACHE_FILE) as f:
+                cache = json.load(f)
+            if cache.get("ssid") == self.ssid:
+                return cache
+        except:
+            pass
+        return None
+
+    def _save_cache(self, bssid, channel):
+        cache = {"ssid": self.ssid, "bssid": bssid, "channel": channel, "ifconfig": list(self.wlan.ifconfig())}
+        try:
+            with open(CACHE_FILE, "w") as f:
+                json.dump(cache, f)
+        except OSError as e:
+            Logger.warn("Could not save Wi-Fi cache: %s", e)
+
+    def _forget_lease(self):
+        cache = self._load_cache()
+        if cache and cache.pop("ifconfig", None):
+            try:
+                with open(CACHE_FILE, "w") as f:
+                    json.dump(cache, f)
+            except OSError:
+                pass
+
+    def _scan(self):
+        """ Strongest AP advertising our SSID as (bssid_hex, channel), or (None, None).
+
+        wlan.scan() blocks the event loop for the whole scan, so it is only
+        run by _learn_ap, once, while online; never on the connect path.
+        """
+        best = None
+        try:
+            for ap in self.wlan.scan():  # (ssid, bssid, channel, rssi, security, hidden)
+                if ap[0].decode() == self.ssid and (best is None or ap[3] > best[2]):
+                    best = (binascii.hexlify(ap[1]).decode(), ap[2], ap[3])
+        except OSError as e:
+            Logger.warn("Wi-Fi scan failed: %s", e)
+        return (best[0], best[1]) if best else (None, None)
+
+    async def _join(self, bssid, timeout_ms, ifconfig=None, channel=None):
+        """ Start a join and poll wlan.status() until it has an IP, fails or times out """
+        if ifconfig:
+            self.wlan.ifconfig(tuple(ifconfig))
+        if bssid and channel:  # Pinned to the cached AP and channel: cyw43 skips the channel sweep
+            self.wlan.connect(self.ssid, self.password, bssid=binascii.unhexlify(bssid), channel=channel)
+        elif bssid:
+            self.wlan.connect(self.ssid, self.password, bssid=binascii.unhexlify(bssid))
+        else:
+            self.wlan.connect(self.ssid, self.password)
+        start = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+            status = self.wlan.status()
+            if status == STAT_GOT_IP:
+                self.ip_address = self.wlan.ifconfig()[0]
+                self.wifi_status = "Connected"
+                Logger.info("Connected in %d ms! IP: %s", time.ticks_diff(time.ticks_ms(), start), self.ip_address)
+                self.reconnect_attempts = 0  # Reset counter after successful connection
+                reachability.tracker.mark_joined()
+                return True
+            if status < 0:  # Wrong password, no AP found or join failure
+                Logger.debug("Join failed with status %d", status)
+                break
+            await asyncio.sleep_ms(self.poll_ms)
+        self.wlan.disconnect()
+        return False
+
+    def _use_dhcp(self):
+        if self._lease_reused and not self.static_ip:
             try:
-                if not self.wlan.active():
-                    Logger.debug("Activating WLAN interface...")
-                    self.wlan.active(True)
-
-                Logger.debug(f"Connecting to {self.ssid}...")
-                self.wlan.connect(self.ssid, self.password)
-
-                max_attempts = 10
-                for attempt in range(max_attempts):
-                    if self.wlan.isconnected():
-                        await asyncio.sleep(2)  # Give time for IP assignment
-                        self.ip_address = self.wlan.ifconfig()[0]
-                        self.wifi_status = "Connected"
-                        Logger.info(f"Connected! IP: {self.ip_address}")
-                        self.reconnect_attempts = 0  # Reset counter after successful connection
-                        return
-                    await asyncio.sleep(2)
-
-                self.wifi_status = "Disconnected"
-                Logger.error("Failed to connect!")
-
-            except OSError as e:
-                Logger.error(f"Wi-Fi connection error: {e}")
+                self.wlan.ifconfig("dhcp")
+            except (OSError, TypeError, ValueError):
+                pass  # Port without ifconfig("dhcp"); the next join renegotiates anyway
+        self._lease_reused = False
+
+    async def connect(self):
+        """ Join Wi-Fi: the cached AP first, then a full scan-and-join. Returns True when online """
+        if self.wlan.isconnected():
+            return True
+        try:
+            if not self.wlan.active():
+                Logger.debug("Activating WLAN interface...")
+                self.wlan.active(True)
+
+            cache = self._load_cache()
+            if cache and cache.get("bssid"):
+                Logger.debug("Fast reconnect to %s via %s (ch %s)", self.ssid, cache["bssid"], cache.get("channel"))
+                ifconfig = self.static_ip or (cache.get("ifconfig") if self.reuse_lease else None)
+                self._lease_reused = bool(ifconfig) and not self.static_ip
+                if await self._join(cache["bssid"], self.fast_timeout_ms, ifconfig, cache.get("channel")):
+                    if list(self.wlan.ifconfig()) != cache.get("ifconfig"):
+                        self._save_cache(cache["bssid"], cache.get("channel"))  # New lease
+                    return True
+                self._use_dhcp()
+
+            Logger.debug("Connecting to %s...", self.ssid)
+            if await self._join(None, self.connect_timeout_ms, self.static_ip):
+                # No usable cached AP (none yet, or it failed): cache the IP config
+                # now and let a background task learn the BSSID once we are settled
+                self._save_cache(None, None)
+                if not self._learning:
+                    self._learning = True
+                    asyncio.create_task(self._learn_ap())
+                return True
+
+            self.wifi_status = "Disconnected"
+            Logger.error("Failed to connect!")
+
+        except OSError as e:
+            Logger.error("Wi-Fi connection error: %s", e)
+        return False
+
+    async def _learn_ap(self):
+        """ Fill the cache with the AP's BSSID and channel for fast reconnects """
+        try:
+            await asyncio.sleep_ms(LEARN_DELAY_MS)
+            if not self.wlan.isconnected():
+                return  # The next successful full join schedules another attempt
+            cache = self._load_cache()
+            if cache and cache.get("bssid"):
+                return
+            bssid, channel = self._scan()
+            if bssid:
+                self._save_cache(bssid, channel)
+                Logger.debug("Cached AP %s (ch %s) for fast reconnect", bssid, channel)
+        finally:
+            self._learning = False
 
     async def check_internet(self):
-        """ Check Internet availability with retry logic """
+        """ Update Internet status; probes only when no recent traffic has proven it """
         if not self.wlan.isconnected():
             self.internet_available = False
             self.internet_status = "Disconnected"
+            reachability.tracker.mark_down()
             return  # Skip check if Wi-Fi is disconnected
 
-        retry_count = 3
-        for _ in range(retry_count):
-            try:
-                response = urequests.get("http://clients3.google.com/generate_204", timeout=3)
-                response.close()
-                if not self.internet_available:
-                    self.internet_available = True
-                    self.internet_status = "Connected"
-                return
-            except Exception as e:
-                Logger.warn(f"Internet check failed: {e}")
-                await asyncio.sleep(2)  # Short delay before retry
+        if await reachability.tracker.check():
+            if not self.internet_available:
+                self.internet_available = True
+                self.internet_status = "Connected"
+            return
+
+        Logger.warn("Internet probe (%s) failed", reachability.tracker.method)
+        if self._lease_reused:
+            # The reused lease may have expired or clash; rejoin with DHCP next time
+            Logger.warn("No Internet on the cached IP config, falling back to DHCP")
+            self._forget_lease()
+            self._use_dhcp()
+            self.wlan.disconnect()
 
         if self.internet_available:  # Only log change if status was previously connected
             self.internet_available = False
@@ -71,7 +209,8 @@ class WiFiManager:
             Logger.error("Internet connection lost!")
 
     async def monitor_connection(self):
-        """ Continuously check Wi-Fi & Internet status with forced refresh """
+        """ Continuously check Wi-Fi & Internet status; reconnects back off while the AP is gone """
+        await self.connect()
         while True:
             self.wifi_status = "Connected" if self.wlan.isconnected() else "Disconnected"
             
@@ -80,15 +219,19 @@ class WiFiManager:
 
             if self.wifi_status == "Disconnected":
                 self.reconnect_attempts += 1
-                Logger.warn(f"Wi-Fi disconnected! Attempting reconnect ({self.reconnect_attempts})...")
-                await self.connect()
+                Logger.warn("Wi-Fi disconnected! Attempting reconnect (%d)...", self.reconnect_attempts)
+                if not await self.connect():
+                    delay = self._retry.next_ms()
+                    Logger.debug("Next Wi-Fi attempt in %d ms", delay)
+                    await asyncio.sleep_ms(delay)
+                    continue
+                self._retry.reset()
             
             await self.check_internet()
             await asyncio.sleep(5)
 
     def start(self):
         """ Start Wi-Fi connection and monitoring """
-        asyncio.create_task(self.connect())
         asyncio.create_task(self.monitor_connection())
 
     def get_status(self):
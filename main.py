@@ -1,75 +1,143 @@
+import bootprof
+bootprof.mark("start")
 import uasyncio as asyncio
 import machine
 import gc
+import sys
 import os
 import time
 import logger
 from machine import Pin
-from ota import OTAUpdater
-from ledblinker import LEDBlinker
+import ledpattern
+from ledpattern import LEDPattern
 from wifi_manager import WiFiManager
+from backoff import Backoff, device_offset_ms
+from loopmon import LoopMonitor
+import memtel
+from status_server import StatusServer
+import reachability
+import integrity
 
-from config_loader import load_config
-config = load_config()
+bootprof.mark("imports")
 
+from config_loader import ConfigStore
+cfg = ConfigStore()  # Defaults and schema in config_loader.DEFAULTS; watched for changes at runtime
+bootprof.mark("config")
+
+# --- Optional Task Profiler (before any task is created) ---
+PROFILE_TASKS = cfg.get("debug.profile_tasks")
+if PROFILE_TASKS:
+    import taskprof
+    taskprof.enable(budget_us=cfg.get("debug.slow_resume_us"))
 
 
 # --- Config ---
-REPO_URL = "https://raw.githubusercontent.com/liftronix/pi_pico_test/refs/heads/main"
-MIN_FREE_MEM = 100 * 1024
-FLASH_BUFFER = 16 * 1024  # 16 KB safety margin
+# Fixed for the life of this boot; everything else is read from cfg where it is
+# used or pushed to its module by the subscribers below (see apply_config)
+OTA_LAYOUT = cfg.get("ota.layout")  # "flat" or "ab" (see boot.py)
+FAST_BOOT = cfg.get("boot.fast")  # Skip the REPL delay and verify OTA commits in the background
+REPL_DELAY_FLAG = "/repl_delay.flag"     # Create to get the 3 s REPL window back on the next boot
 
 # --- Boot Delay for REPL Access ---
-print("⏳ Boot delay... press Stop in Thonny to break into REPL")
-time.sleep(3)
+def want_repl_delay():
+    if not FAST_BOOT or REPL_DELAY_FLAG[1:] in os.listdir("/"):
+        return True
+    pin = cfg.get("boot.repl_pin")  # Optional GPIO held low at power-on
+    return pin is not None and not Pin(pin, Pin.IN, Pin.PULL_UP).value()
+
+if want_repl_delay():
+    print("⏳ Boot delay... press Stop in Thonny to break into REPL")
+    time.sleep(3)
+
+# --- LED Setup ---
+# Every LED signal is a pattern pushed onto this one timer-driven engine
+leds = LEDPattern('LED')
 
 # --- Safe Mode via GPIO14 ---
 safe_pin = Pin(14, Pin.IN, Pin.PULL_UP)
 if not safe_pin.value():
     logger.warn("🛑 Safe Mode triggered via GPIO14 — skipping OTA and main loop")
-    import sys
+    leds.push("safe", ledpattern.SAFE_MODE, ledpattern.PRIO_SAFE)  # The timer keeps blinking at the REPL
     sys.exit()
 
-# --- LED Setup ---
-led = Pin('LED', Pin.OUT)
-led.value(0)
-
-def blink_led(times=3, delay=150):
-    for _ in range(times):
-        led.toggle()
-        time.sleep_ms(delay)
-        led.toggle()
-        time.sleep_ms(delay)
-
 # --- Wi-Fi Setup ---
 wifi = WiFiManager(
-    ssid=config.get("wifi", {}).get("ssid", ""),
-    password=config.get("wifi", {}).get("password", ""))
+    ssid=cfg.get("wifi.ssid"),
+    password=cfg.get("wifi.password"),
+    static_ip=cfg.get("wifi.static_ip"),
+    reuse_lease=cfg.get("wifi.reuse_lease"))
+
+# --- Live Config ---
+# Subscribers retune running modules when watch() sees config.json change
+def apply_wifi_config(cfg, keys):
+    wifi.configure(cfg.get("wifi.poll_ms"), cfg.get("wifi.fast_timeout_ms"), cfg.get("wifi.connect_timeout_ms"),
+                   cfg.get("wifi.retry_min_ms"), cfg.get("wifi.retry_max_ms"))
+    wifi.set_credentials(cfg.get("wifi.ssid"), cfg.get("wifi.password"))
+
+def apply_reachability_config(cfg, keys):
+    # Probe method ("dns", "tcp" or "http"), target "host[:port]" and min_s/max_s interval
+    reachability.tracker.configure(**{k: cfg.get("reachability." + k)
+                                      for k in ("method", "target", "min_s", "max_s", "timeout")})
+
+def apply_log_config(cfg, keys):
+    logger.set_levels(console=getattr(logger, cfg.get("log.console_level")),
+                      file=getattr(logger, cfg.get("log.file_level")))
+    logger.Logger.MAX_LOG_SIZE = cfg.get("log.max_size")
+
+ota_poll = Backoff(cfg.get("ota.poll_min_ms"), cfg.get("ota.poll_max_ms"))  # Interval between OTA checks
+
+def apply_ota_config(cfg, keys):
+    # Repo URL, mpy and memory/flash margins are read per poll; only the interval is cached
+    ota_poll.base_ms = cfg.get("ota.poll_min_ms")
+    ota_poll.max_ms = cfg.get("ota.poll_max_ms")
+    ota_poll.reset()
+
+def apply_mem_config(cfg, keys):
+    memtel.configure(auto_tune=cfg.get("mem.auto_tune"), collect_below=cfg.get("mem.collect_below"))
+
+def apply_config():
+    for prefix, apply in (("wifi.", apply_wifi_config), ("reachability.", apply_reachability_config),
+                          ("log.", apply_log_config), ("ota.", apply_ota_config), ("mem.", apply_mem_config)):
+        try:
+            apply(cfg, ())
+        except Exception as e:  # Boot on with the module's own defaults, as _notify does on reload
+            logger.error("⚙️ Applying %s config failed: %s", prefix[:-1], e)
+        cfg.subscribe(prefix, apply)
+    cfg.subscribe("", log_config_change)
+
+def log_config_change(cfg, keys):
+    logger.info("⚙️ Config reloaded: %s", ", ".join(sorted(keys)))
+    for err in cfg.errors:
+        logger.warn("⚙️ Config value ignored: %s", err)
+
+apply_config()
 wifi.start()
+bootprof.mark("wifi_started")
 
-# --- CPU Utilization Monitor ---
-idle_counter = 0
-async def idle_task():
-    global idle_counter
-    while True:
-        idle_counter += 1
-        await asyncio.sleep_ms(0)
+# --- Event-Loop Health ---
+LOOP_LAG_WARN_MS = 250  # Worst wakeup lag that starts to show as LED / status stutter
+loopmon = LoopMonitor(period_ms=100)
+last_loop_window = {}  # Stats of the last completed 10 s window, for the status server
 
-async def monitor():
-    global idle_counter
-    while True:
-        idle_start = idle_counter
-        await asyncio.sleep(1)
-        idle_end = idle_counter
-        idle_ticks = idle_end - idle_start
-        print(f"Utilization: {(1808 - idle_ticks) / 1808 * 100:.2f} %")
+def report_loop_health():
+    # Healthy windows only go to the status server: a log line every 10 s would mean a flash append every 10 s
+    global last_loop_window
+    stats = loopmon.stats(reset=True)
+    del stats["histogram"]
+    last_loop_window = stats
+    if stats["max_ms"] > LOOP_LAG_WARN_MS:
+        logger.warn("🐢 Event loop blocked for up to %d ms (p99 %d ms)", stats["max_ms"], stats["p99_ms"])
 
 # --- OTA Logic ---
 def has_enough_memory():
     gc.collect()
-    free = gc.mem_free()
-    logger.debug(f"Free memory: {free} bytes")
-    return free >= MIN_FREE_MEM
+    free, _, largest = memtel.sample("pre-ota", probe=True)
+    logger.debug("Free memory: %d bytes, largest block: %d bytes", free, largest)
+    return free >= cfg.get("ota.min_free_mem") and largest >= cfg.get("ota.min_free_block")
+
+def log_memory_report():
+    for line in memtel.report():
+        logger.info("🧠 %s", line)
 
 def get_free_flash_bytes():
     stats = os.statvfs("/")
@@ -77,110 +145,295 @@ def get_free_flash_bytes():
 
 def get_local_version():
     try:
-        with open("/version.txt") as f:
+        # Relative path: boot.py changes into the active slot in A/B layout
+        with open("version.txt") as f:
             return f.read().strip()
     except:
         return "0.0.0"
 
 async def show_progress(ota):
     while ota.get_progress() < 100:
-        led.toggle()
-        logger.info(f"OTA {ota.get_progress():>3}% - {ota.get_status()}")
+        logger.info("OTA %3d%% - %s", ota.get_progress(), ota.get_status())
         await asyncio.sleep(0.4)
-    led.value(1)
+
+# The OTA stack is only resident while it is in use: load_ota() imports it on
+# demand and unload_ota() drops the modules again so polls cost no idle heap.
+OTA_MODULES = ("ota", "http_client")
+
+def load_ota():
+    from ota import OTAUpdater
+    return OTAUpdater(cfg.get("ota.repo_url"), layout=OTA_LAYOUT, use_mpy=cfg.get("ota.mpy"))
+
+def unload_ota():
+    # Callers must drop their updater reference first, or the class stays alive
+    for name in OTA_MODULES:
+        sys.modules.pop(name, None)
+    gc.collect()
 
 async def apply_ota_if_pending():
     if "ota_pending.flag" in os.listdir("/"):
         logger.info("🟡 ota_pending.flag detected — applying OTA update")
-        ota = OTAUpdater(REPO_URL)
+        ota = load_ota()
         if await ota.apply_update():
             logger.info("🔁 OTA applied successfully. Rebooting into commit verification state...")
+            log_memory_report()
+            logger.flush()
             machine.reset()
         else:
             logger.error("❌ OTA apply failed. Rolling back.")
-            await ota.rollback()
-            try:
-                os.remove("ota_pending.flag")
-                logger.info("🗑 ota_pending.flag removed after failed apply")
-            except:
-                logger.warn("Could not remove ota_pending.flag after failed apply")
+            await ota.rollback()  # Also clears ota_pending.flag
+            log_memory_report()
+        await ota.release()
+        ota = None
+        unload_ota()
+
+# Files under the install root that OTA does not own
+INTEGRITY_EXCLUDE = integrity.EXCLUDE + (("boot.py",) if OTA_LAYOUT == "ab" else ())
+last_integrity = None  # Result of the latest verify_installation(), for the status server
+
+async def check_integrity():
+    global last_integrity
+    # Relative to the running tree: the active slot in A/B layout, else the root
+    result = await integrity.verify_installation(root=os.getcwd().rstrip("/"), exclude=INTEGRITY_EXCLUDE)
+    last_integrity = result
+    if result["missing"] or result["corrupt"]:
+        logger.error("🧩 Integrity check failed: missing %s, corrupt %s", result["missing"], result["corrupt"])
+    elif not result["ok"]:
+        logger.warn("🧩 Integrity check skipped: no local manifest")
+    else:
+        logger.info("🧩 Integrity OK: %d files, %d re-hashed", result["total"], result["hashed"])
+    return result
+
+def commit_ota():
+    try:
+        os.remove("/ota_commit_pending.flag")
+        logger.info("🗑 ota_commit_pending.flag removed after successful commit")
+    except Exception as e:
+        logger.warn("Could not remove ota_commit_pending.flag: %s", e)
 
 async def verify_ota_commit():
     if "ota_commit_pending.flag" not in os.listdir("/"):
         return  # Nothing to verify
 
     logger.info("🔎 Verifying OTA commit (commit-pending state detected)...")
-    ota = OTAUpdater(REPO_URL)
+    if not (await check_integrity())["ok"]:
+        logger.error("❌ Installed files do not match the manifest. Initiating rollback...")
+        ota = load_ota()
+        await ota.rollback()
+        logger.flush()
+        machine.reset()
+    ota = load_ota()
 
+    reached = False
     for _ in range(12):  # Retry for 60 seconds
         try:
-            if not await ota.check_for_update():
+            result = await ota.check_for_update()
+            if result is False:
                 logger.info("✅ OTA commit verified. Remote matches local version.")
-                try:
-                    os.remove("ota_commit_pending.flag")
-                    logger.info("🗑 ota_commit_pending.flag removed after successful commit")
-                except Exception as e:
-                    logger.warn(f"Could not remove ota_commit_pending.flag: {e}")
+                commit_ota()
+                await ota.release()
+                ota = None
+                unload_ota()
                 return
+            reached = reached or result is not None  # None: server not reached (e.g. Wi-Fi still joining)
         except Exception as e:
-            logger.warn(f"Commit check attempt failed: {e}")
+            logger.warn("Commit check attempt failed: %s", e)
         await asyncio.sleep(5)
 
+    if not reached:
+        # An outage says nothing about the new firmware: neither commit nor roll back.
+        # The flag stays and the first successful OTA poll commits it.
+        logger.warn("⏳ OTA commit unverified: update server unreachable, check deferred")
+        await ota.release()
+        ota = None
+        unload_ota()
+        return
+
     logger.error("❌ OTA commit verification failed. Initiating rollback...")
     await ota.rollback()
+    logger.flush()
+    machine.reset()  # Boot back into the restored firmware
+
+current_ota = None  # Updater of the running OTA loop, for the status server
+
+commit_checked = None  # Event set once commit verification is over; OTA polling waits for it
+
+async def run_commit_check():
+    try:
+        await verify_ota_commit()
+    finally:
+        commit_checked.set()
+
+async def check_boot_integrity():
+    await commit_checked.wait()
+    if last_integrity is None:  # A commit check already verified the tree
+        await check_integrity()
 
 async def check_and_download_ota():
-    updater = OTAUpdater(REPO_URL)
+    global current_ota
+    await commit_checked.wait()
+    # Spread first polls so a fleet powered on together does not hit the server at once
+    await asyncio.sleep_ms(device_offset_ms(ota_poll.base_ms // 4))
     while True:
+        updater = current_ota = load_ota()
         logger.info("🔍 Checking for OTA update...")
-        if await updater.check_for_update():
+        result = await updater.check_for_update()
+        if result:
+            ota_poll.reset()
             logger.info("🆕 Update available.")
             if has_enough_memory():
                 required = updater.get_required_flash_bytes()
                 free = get_free_flash_bytes()
-                logger.debug(f"Flash required: {required + FLASH_BUFFER} | Available: {free}")
-                if free < required + FLASH_BUFFER:
+                required += cfg.get("ota.flash_buffer")  # Safety margin
+                logger.debug("Flash required: %d | Available: %d", required, free)
+                if free < required:
                     logger.warn("🚫 Not enough flash space for OTA.")
                 else:
                     logger.info("📥 Downloading update before reboot...")
+                    leds.push("ota", ledpattern.OTA_PROGRESS, ledpattern.PRIO_OTA)
                     progress_task = asyncio.create_task(show_progress(updater))
                     if await updater.download_update():
                         progress_task.cancel()
-                        led.value(1)
+                        leds.push("ota", ledpattern.ON, ledpattern.PRIO_OTA)
                         logger.info("✅ Update downloaded. Preparing to reboot...")
+                        log_memory_report()
                         with open("/ota_pending.flag", "w") as f:
                             f.write("ready")
                         for i in range(10, 0, -1):
                             print(f"Rebooting in {i} seconds... Press Ctrl+C to cancel.")
                             await asyncio.sleep(1)
+                        logger.flush()
                         machine.reset()
                     else:
                         progress_task.cancel()
-                        led.value(0)
+                        leds.pop("ota")
+                        leds.push("error", ledpattern.error_code(3), ledpattern.PRIO_ERROR, count=3)
                         logger.error("❌ Download failed. OTA aborted.")
+                        log_memory_report()
             else:
                 logger.warn("🚫 Not enough memory for OTA.")
-        else:
+        elif result is False:
             logger.info("✅ Firmware is up to date.")
-        await asyncio.sleep(60)
+            if "ota_commit_pending.flag" in os.listdir("/"):  # Commit check deferred by an outage at boot
+                logger.info("✅ OTA commit verified. Remote matches local version.")
+                commit_ota()
+        else:
+            logger.warn("⚠️ OTA check failed, will retry")
+        await updater.release()
+        updater = current_ota = None
+        unload_ota()
+        delay = ota_poll.next_ms()
+        logger.debug("Next OTA check in %d s", delay // 1000)
+        await asyncio.sleep_ms(delay)
+
+# --- Status Server ---
+status_server = StatusServer(port=cfg.get("status.port"),
+                             max_clients=cfg.get("status.max_clients"))
+
+def wifi_section():
+    status = wifi.get_status()
+    status["IP"] = wifi.get_ip_address()
+    return status
+
+def ota_section():
+    files = os.listdir("/")
+    state = {
+        "layout": OTA_LAYOUT,
+        "pending": "ota_pending.flag" in files,
+        "commit_pending": "ota_commit_pending.flag" in files,
+    }
+    if current_ota:
+        state["progress"] = current_ota.get_progress()
+        state["status"] = current_ota.get_status()
+        state["remote_version"] = current_ota.remote_version
+    return state
+
+def integrity_section():
+    return last_integrity
+
+def loop_section():
+    stats = loopmon.stats()
+    stats["last_window"] = last_loop_window
+    return stats
+
+def memory_section():
+    return {"free": gc.mem_free(), "alloc": gc.mem_alloc(), "phases": memtel.phases()}
+
+status_server.add("version", get_local_version)
+status_server.add("boot", bootprof.marks)
+status_server.add("wifi", wifi_section)
+status_server.add("reachability", reachability.tracker.status)
+status_server.add("ota", ota_section)
+status_server.add("integrity", integrity_section)
+status_server.add("loop", loop_section)
+status_server.add("memory", memory_section)
+status_server.add("led", leds.active)
+status_server.add("config", lambda: {"errors": cfg.errors})
+if PROFILE_TASKS:
+    status_server.add("tasks", taskprof.stats)
+
+# --- Boot Profile ---
+async def finish_boot_profile(timeout_ms=30000):
+    # Wait (off the critical path) for the network so the profile shows time-to-online
+    start = time.ticks_ms()
+    while not wifi.wlan.isconnected() and time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+        await asyncio.sleep_ms(50)
+    if wifi.wlan.isconnected():
+        bootprof.mark("online")
+    logger.info("⏱ Boot: %s", bootprof.summary())
+    bootprof.save()
+
+async def start_loop_monitor():
+    # Runs alongside the boot tasks; calibrate() keeps the smallest lag, which they cannot inflate
+    baseline = await loopmon.calibrate(samples=10)
+    logger.debug("Loop monitor baseline lag: %d ms", baseline)
+    loopmon.start()
 
 # --- Main Entry Point ---
 async def main():
-    logger.info(f"🧾 Running firmware version: {get_local_version()}")
+    global commit_checked
+    logger.use_segment_store()
+    logger.enable_buffering()
+    memtel.sample("boot", probe=True)
+    logger.info("🧾 Running firmware version: %s", get_local_version())
+    bootprof.mark("logger")
     await apply_ota_if_pending()
-    await verify_ota_commit()
+    bootprof.mark("ota_apply")
+    commit_checked = asyncio.Event()
+    if FAST_BOOT:
+        asyncio.create_task(run_commit_check())
+    else:
+        await run_commit_check()
+        bootprof.mark("ota_commit")
 
-    asyncio.create_task(idle_task())
-    asyncio.create_task(monitor())
+    asyncio.create_task(check_boot_integrity())
+    asyncio.create_task(start_loop_monitor())
+    if cfg.get("status.enabled"):
+        try:
+            await status_server.start()
+            logger.info("📡 Status server listening on port %d", status_server.port)
+        except OSError as e:
+            logger.warn("Status server not started: %s", e)
     asyncio.create_task(check_and_download_ota())
 
-    led_blinker = LEDBlinker(pin_num='LED', interval_ms=2000)
-    led_blinker.start()
+    leds.push("heartbeat", ledpattern.HEARTBEAT)
+    bootprof.mark("ready")
+    asyncio.create_task(finish_boot_profile())
+    asyncio.create_task(cfg.watch())
 
+    cycles = 0
     while True:
-        status = wifi.get_status()
-        print(f"WiFi Status: {status['WiFi']}, Internet Status: {status['Internet']}")
-        print(f"Current IP Address: {wifi.get_ip_address()}")
+        if cfg.get("status.console"):
+            status = wifi.get_status()
+            print(f"WiFi Status: {status['WiFi']}, Internet Status: {status['Internet']}")
+            print(f"Current IP Address: {wifi.get_ip_address()}")
+        report_loop_health()
+        if PROFILE_TASKS:
+            if cfg.get("status.console"):
+                print(taskprof.table())
+            cycles += 1
+            if cycles % 6 == 0:  # Once a minute, to spare the flash
+                taskprof.dump()
         await asyncio.sleep(10)
 
 asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""Build manifest.json (and optionally a compressed OTA bundle) from the repo tree.
+
+Runs on the host with CPython:
+
+    python tools/build_manifest.py              # refresh hashes/sizes
+    python tools/build_manifest.py --bundle     # also write bundles/<version>.bin
+    python tools/build_manifest.py --mpy        # also cross-compile lib/ to mpy/lib/*.mpy
+
+Hashes and sizes are taken after CRLF → LF normalisation, which is what
+OTAUpdater writes to flash for text files.
+
+Bundle layout (zlib stream, 1 KB window so the device inflates with little RAM):
+    b"OTB1", then per file: u16 path length, path (utf-8), u32 data length, data
+    and a terminating u16 zero.
+
+With --mpy every lib/ module is compiled with mpy-cross (from PATH, the
+mpy_cross pip package, or --mpy-cross) into MPY_DIR and listed in a
+manifest "mpy" section:
+    {"version": 6, "dir": "mpy", "files": {"lib/ota.mpy": {...}}}
+Keys are install paths; each replaces the .py of the same name on devices
+whose sys.implementation._mpy has that version. main.py and boot.py stay
+source, MicroPython only runs them as .py. The output is bytecode only (no
+-march), so one build serves every port of that .mpy version.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_FILES = ["boot.py", "config.json", "main.py", "version.txt"]
+LIB_DIR = "lib"
+BUNDLE_DIR = "bundles"
+BUNDLE_MAGIC = b"OTB1"
+BUNDLE_WBITS = 10
+NORMALIZE_EXT = (".py", ".txt", ".json", ".md")
+MPY_DIR = "mpy"
+
+
+def repo_files(root):
+    files = [f for f in ROOT_FILES if os.path.isfile(os.path.join(root, f))]
+    lib_files = []
+    for dirpath, dirnames, filenames in os.walk(os.path.join(root, LIB_DIR)):
+        dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+        for name in filenames:
+            if name.endswith(".py"):
+                rel = os.path.relpath(os.path.join(dirpath, name), root)
+                lib_files.append(rel.replace(os.sep, "/"))
+    return files + sorted(lib_files)
+
+
+def read_normalized(root, rel):
+    with open(os.path.join(root, rel), "rb") as f:
+        data = f.read()
+    if rel.endswith(NORMALIZE_EXT):
+        data = data.replace(b"\r\n", b"\n")
+    return data
+
+
+def mpy_cross_command(path=None):
+    if path:
+        return [path]
+    if shutil.which("mpy-cross"):
+        return ["mpy-cross"]
+    try:
+        import mpy_cross  # noqa: F401
+    except ImportError:
+        raise SystemExit("mpy-cross not found: pip install mpy-cross, or pass --mpy-cross PATH")
+    return [sys.executable, "-m", "mpy_cross"]
+
+
+def compile_mpy(root, lib_files, command, opt=None):
+    """ Cross-compile lib_files into root/MPY_DIR; returns (mpy section, {install path: bytes}) """
+    section = {"dir": MPY_DIR, "files": {}}
+    artifacts = {}
+    for rel in lib_files:
+        target = rel[:-3] + ".mpy"
+        out = os.path.join(root, MPY_DIR, target)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        args = command + ["-o", out, "-s", rel]
+        if opt is not None:
+            args.append(f"-O{opt}")
+        subprocess.run(args + [os.path.join(root, rel)], check=True)
+        with open(out, "rb") as f:
+            data = f.read()
+        # Header: b"M", version, native arch << 2 | sub-version, small-int bits.
+        # Bytecode-only files (arch 0) load on any VM of the same version.
+        if data[:1] != b"M" or data[2] >> 2:
+            raise SystemExit(f"mpy-cross wrote an unexpected file: {out}")
+        if section.setdefault("version", data[1]) != data[1]:
+            raise SystemExit(f"Mixed .mpy versions in build: {out}")
+        section["files"][target] = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+        artifacts[target] = data
+    return section, artifacts
+
+
+def build_bundle(contents):
+    out = bytearray(BUNDLE_MAGIC)
+    for rel, data in contents.items():
+        path = rel.encode()
+        out += struct.pack(">H", len(path)) + path + struct.pack(">I", len(data)) + data
+    out += struct.pack(">H", 0)
+    comp = zlib.compressobj(9, zlib.DEFLATED, BUNDLE_WBITS)
+    return comp.compress(bytes(out)) + comp.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=ROOT, help="repository root")
+    parser.add_argument("--version", help="set version (also rewrites version.txt)")
+    parser.add_argument("--bundle", action="store_true", help="write a compressed bundle")
+    parser.add_argument("--mpy", action="store_true", help="cross-compile lib/ modules to .mpy")
+    parser.add_argument("--mpy-cross", help="mpy-cross executable")
+    parser.add_argument("--mpy-opt", type=int, help="mpy-cross optimisation level (-O1 drops __debug__ blocks)")
+    args = parser.parse_args()
+    root = args.root
+
+    if args.version:
+        with open(os.path.join(root, "version.txt"), "w") as f:
+            f.write(args.version)
+    with open(os.path.join(root, "version.txt")) as f:
+        version = f.read().strip()
+
+    contents = {rel: read_normalized(root, rel) for rel in repo_files(root)}
+    manifest = {"version": version, "files": {}}
+    for rel, data in contents.items():
+        manifest["files"][rel] = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+
+    if args.mpy:
+        lib_files = [rel for rel in contents if rel.startswith(LIB_DIR + "/")]
+        section, artifacts = compile_mpy(root, lib_files, mpy_cross_command(args.mpy_cross), args.mpy_opt)
+        manifest["mpy"] = section
+        source = sum(len(contents[rel]) for rel in lib_files)
+        print(f"mpy v{section.get('version')}: {len(artifacts)} modules, "
+              f"{sum(len(d) for d in artifacts.values())} bytes ({source} as source)")
+        contents.update(artifacts)  # Bundle carries both; the device unpacks the ones it selected
+
+    if args.bundle:
+        blob = build_bundle(contents)
+        rel = f"{BUNDLE_DIR}/{version}.bin"
+        os.makedirs(os.path.join(root, BUNDLE_DIR), exist_ok=True)
+        with open(os.path.join(root, rel), "wb") as f:
+            f.write(blob)
+        manifest["bundle"] = {"path": rel, "sha256": hashlib.sha256(blob).hexdigest(), "size": len(blob)}
+        raw = sum(len(d) for d in contents.values())
+        print(f"Bundle {rel}: {len(blob)} bytes ({raw} uncompressed, {len(contents)} files)")
+
+    with open(os.path.join(root, "manifest.json"), "w") as f:
+        f.write(json.dumps(manifest, indent=2))
+    print(f"manifest.json: version {version}, {len(manifest['files'])} files")
+
+
+if __name__ == "__main__":
+    main()
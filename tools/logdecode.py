@@ -0,0 +1,89 @@
+"""Decode the device's binary log segments (lib/logstore.py) into text.
+
+Copy the segment files off the device first, e.g. with mpremote:
+
+    mpremote cp :/log0.bin :/log1.bin :/log2.bin :/log3.bin logs/
+    python tools/logdecode.py logs/              # whole history, oldest first
+    python tools/logdecode.py logs/ --grep OTA   # only matching messages
+    python tools/logdecode.py logs/ --tail 50    # last 50 records
+"""
+
+import argparse
+import glob
+import os
+import re
+import struct
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+BOOT = 255
+HEADER = "<I"
+RECORD = "<IBH"
+
+
+def read_segment(path):
+    """Return (seq, [(ticks, level, message), ...]) for one segment file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    hsize, rsize = struct.calcsize(HEADER), struct.calcsize(RECORD)
+    if len(data) < hsize:
+        return None, []
+    seq = struct.unpack_from(HEADER, data)[0]
+    records, pos = [], hsize
+    while pos + rsize <= len(data):
+        ticks, level, n = struct.unpack_from(RECORD, data, pos)
+        pos += rsize
+        if pos + n > len(data):
+            break  # Torn final record
+        records.append((ticks, level, data[pos:pos + n].decode("utf-8", "replace")))
+        pos += n
+    return seq, records
+
+
+def segment_paths(inputs, prefix):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, f"{prefix}*.bin")
+            paths.extend(p for p in glob.glob(pattern)
+                         if re.fullmatch(rf"{re.escape(prefix)}\d+\.bin", os.path.basename(p)))
+        else:
+            paths.append(item)
+    return paths
+
+
+def format_record(ticks, level, msg):
+    if level == BOOT:
+        return f"===== boot ===== {msg}".rstrip()
+    name = LEVELS[level] if level < len(LEVELS) else f"L{level}"
+    return f"+{ticks / 1000:10.3f}s [{name}] {msg}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="segment files or a directory holding them")
+    parser.add_argument("--prefix", default="log", help="segment file prefix (default: log)")
+    parser.add_argument("--grep", help="only show messages matching this regex")
+    parser.add_argument("--tail", type=int, help="only show the last N records")
+    args = parser.parse_args()
+
+    segments = []
+    for path in segment_paths(args.inputs, args.prefix):
+        seq, records = read_segment(path)
+        if seq is not None:
+            segments.append((seq, records))
+    segments.sort()
+
+    lines = []
+    for _, records in segments:
+        for ticks, level, msg in records:
+            if args.grep and level != BOOT and not re.search(args.grep, msg):
+                continue
+            lines.append(format_record(ticks, level, msg))
+    if args.tail:
+        lines = lines[-args.tail:]
+    for line in lines:
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""OTA and boot benchmarks against the simulated device (see simenv.py).
+
+    python tools/sim/bench.py                       # default manifest sizes
+    python tools/sim/bench.py --files 8 32 128 --size 4096 --changed 0.25
+    python tools/sim/bench.py --bundle --latency-ms 40
+    python tools/sim/bench.py --mpy                         # serve .mpy to an mpy v6 device
+    python tools/sim/bench.py --drop-after 3000 --drops 2   # resume path
+    python tools/sim/bench.py --corrupt 1                   # hash mismatch path
+    python tools/sim/bench.py --boot                        # main.py boot timeline
+    python tools/sim/bench.py --json out.json
+
+For each manifest size the device is seeded with version 1.0.0, the server
+publishes 2.0.0 and the real OTAUpdater runs check_for_update ->
+download_update -> apply_update -> rollback. Each phase reports wall time,
+HTTP requests and bytes, flash bytes written and peak heap. Heap comes
+from tracemalloc on CPython, so compare runs with each other rather than
+with a device.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simenv  # noqa: E402
+from repo_server import MPY_DIR, MPY_VERSION, RepoServer, build_manifest, generate_tree  # noqa: E402
+
+PHASES = ("check", "download", "apply", "rollback")
+
+
+async def _measure(name, server, coro):
+    before = server.counters()
+    simenv.STATS.reset()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - t0
+    after = server.counters()
+    return {
+        "phase": name,
+        "result": result,
+        "ms": round(elapsed * 1000, 1),
+        "requests": after["requests"] - before["requests"],
+        "bytes": after["bytes_sent"] - before["bytes_sent"],
+        "flash_written": simenv.STATS.flash_written,
+        "peak_heap": tracemalloc.get_traced_memory()[1] - base,
+    }
+
+
+async def run_ota(flash_dir, n_files, args):
+    simenv.setup(flash_dir)
+    simenv.unload_firmware()
+    old = generate_tree(n_files, args.size, "1.0.0", seed=n_files)
+    new = generate_tree(n_files, args.size, "2.0.0", seed=n_files + 1, changed=args.changed, base=old)
+    manifest, _ = build_manifest(old, "1.0.0")
+    simenv.install_tree(old)
+    simenv.install_tree({"manifest.json": json.dumps(manifest).encode()})
+
+    corrupt = [p for p in new if p.startswith("lib/") and new[p] != old.get(p)][:args.corrupt]
+    if args.mpy:
+        corrupt = [f"{MPY_DIR}/{p[:-3]}.mpy" for p in corrupt]
+    server = RepoServer(new, "2.0.0", bundle=args.bundle, latency_ms=args.latency_ms,
+                        drop_after=args.drop_after, drops=args.drops, corrupt=corrupt, mpy=args.mpy)
+    # The device advertises its .mpy version through sys.implementation._mpy
+    sys.implementation._mpy = MPY_VERSION if args.mpy else 0
+    await server.start()
+    import gc
+    import logger
+    import memtel
+    import ota
+    if not args.verbose:
+        logger.set_levels(console=logger.OFF)
+    # The largest-block probe allocates up to the whole free heap by design,
+    # which would swamp the peak-heap figures; report free heap instead
+    memtel.largest_block = lambda limit=None, step=256: gc.mem_free()
+    updater = ota.OTAUpdater(server.url)
+    rows = []
+    try:
+        rows.append(await _measure("check", server, updater.check_for_update()))
+        delta = len(updater.changed)
+        ok = False
+        if not rows[-1]["result"]:
+            return _tag(rows, n_files, delta)
+        for _ in range(1 + args.drops):  # Retries exercise the resume journal
+            row = await _measure("download", server, updater.download_update())
+            if rows[-1]["phase"] == "download":
+                for k in ("ms", "requests", "bytes", "flash_written"):
+                    row[k] += rows[-1][k]
+                row["peak_heap"] = max(row["peak_heap"], rows[-1]["peak_heap"])
+                rows.pop()
+            rows.append(row)
+            ok = row["result"]
+            if ok:
+                break
+            await updater.check_for_update()
+        if ok:
+            simenv.install_tree({"ota_pending.flag": b"ready"})
+            rows.append(await _measure("apply", server, updater.apply_update()))
+            rows.append(await _measure("rollback", server, updater.rollback()))
+    finally:
+        await server.stop()
+    return _tag(rows, n_files, delta)
+
+
+def _tag(rows, n_files, delta):
+    for row in rows:
+        row["files"] = n_files
+        row["delta"] = delta
+    return rows
+
+
+def print_table(rows):
+    cols = ("files", "delta", "phase", "result", "ms", "requests", "bytes", "flash_written", "peak_heap")
+    print("  ".join(f"{c:>13}" for c in cols))
+    for row in rows:
+        print("  ".join(f"{str(row[c]):>13}" for c in cols))
+
+
+def run_boot(args):
+    """ Run main.py in a child process for a few seconds and read back its boot profile """
+    flash = tempfile.mkdtemp(prefix="simflash-")
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--boot-child", flash,
+                        "--seconds", str(args.seconds)], timeout=args.seconds + 30)
+        with open(os.path.join(flash, "bootprof.json")) as f:
+            profile = json.load(f)[-1]
+    except (OSError, ValueError, IndexError, subprocess.TimeoutExpired) as e:
+        print(f"No boot profile recorded: {e}")
+        return None
+    finally:
+        shutil.rmtree(flash, ignore_errors=True)
+    prev = 0
+    for name, t in profile["marks"]:
+        print(f"{name:>14} {t:>7} ms  (+{t - prev} ms)")
+        prev = t
+    return profile
+
+
+def boot_child(flash, seconds):
+    import threading
+    simenv.setup(flash)
+    config = {"wifi": {"ssid": "SIM", "password": "sim"},
+              "status": {"port": 0}, "ota": {"repo_url": "http://127.0.0.1:9"}}
+    simenv.install_tree({"config.json": json.dumps(config).encode(), "version.txt": b"1.0.0"})
+    threading.Timer(seconds, lambda: os._exit(0)).start()
+    simenv.run_main()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[4, 16, 64], help="manifest sizes (lib modules)")
+    parser.add_argument("--size", type=int, default=2048, help="bytes per module")
+    parser.add_argument("--changed", type=float, default=0.5, help="fraction of modules that change")
+    parser.add_argument("--bundle", action="store_true", help="publish a compressed bundle")
+    parser.add_argument("--mpy", action="store_true", help="publish precompiled .mpy modules")
+    parser.add_argument("--latency-ms", type=int, default=0, help="server latency per request")
+    parser.add_argument("--drop-after", type=int, help="disconnect after N body bytes")
+    parser.add_argument("--drops", type=int, default=0, help="how many responses to cut off")
+    parser.add_argument("--corrupt", type=int, default=0, help="serve N changed files with a bad hash")
+    parser.add_argument("--boot", action="store_true", help="benchmark main.py boot instead of OTA")
+    parser.add_argument("--seconds", type=float, default=6, help="how long to run main.py for --boot")
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the firmware's console log")
+    parser.add_argument("--boot-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.boot_child:
+        boot_child(args.boot_child, args.seconds)
+        return
+    if args.boot:
+        results = run_boot(args)
+    else:
+        tracemalloc.start()
+        flash = tempfile.mkdtemp(prefix="simflash-")
+        try:
+            asyncio.run(run_ota(flash, 1, args))  # Warm-up: first-use imports and caches
+        finally:
+            shutil.rmtree(flash, ignore_errors=True)
+        results = []
+        for n in args.files:
+            flash = tempfile.mkdtemp(prefix="simflash-")
+            try:
+                results += asyncio.run(run_ota(flash, n, args))
+            finally:
+                shutil.rmtree(flash, ignore_errors=True)
+        print_table(results)
+    if args.json and results is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Local HTTP server standing in for the raw.githubusercontent.com repo.
+
+Serves a generated firmware tree plus its manifest.json (and optionally a
+compressed bundle and an .mpy set) with HTTP/1.1 keep-alive, Range requests and ETag/304,
+and can inject faults:
+
+    latency_ms   delay before every response
+    drop_after   close the connection after this many body bytes of a file ...
+    drops        ... for this many responses (then behave)
+    corrupt      paths whose served bytes are altered (hash mismatch)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from build_manifest import MPY_DIR, build_bundle  # noqa: E402
+
+MPY_VERSION = 6
+
+
+def generate_tree(n_files, file_size, version, seed=0, changed=1.0, base=None):
+    """ {path: bytes} of n_files python-looking modules under lib/.
+
+    With base given, only a `changed` fraction of base's modules differ.
+    """
+    rng = random.Random(seed)
+    files = {"version.txt": version.encode(), "main.py": b"# main %s\n" % version.encode()}
+    for i in range(n_files):
+        path = f"lib/mod{i:03d}.py"
+        if base is not None and path in base and rng.random() >= changed:
+            files[path] = base[path]
+            continue
+        lines, size = [], 0
+        while size < file_size:
+            line = f"VALUE_{i}_{rng.randrange(1 << 30)} = {rng.random()!r}  # {version}\n"
+            lines.append(line)
+            size += len(line)
+        files[path] = "".join(lines).encode()[:file_size]
+    return files
+
+
+def fake_mpy(data):
+    # Stand-in for mpy-cross output: a v6 bytecode-only header and about the
+    # size ratio real lib/ modules compile to (~36% of source)
+    return bytes([ord("M"), MPY_VERSION, 0, 31]) + data[:len(data) * 36 // 100]
+
+
+def build_manifest(files, version, bundle=False, mpy=False):
+    manifest = {"version": version, "files": {
+        rel: {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)} for rel, data in files.items()}}
+    blobs = {}
+    if mpy:
+        section = {"version": MPY_VERSION, "dir": MPY_DIR, "files": {}}
+        for rel, data in files.items():
+            if rel.startswith("lib/") and rel.endswith(".py"):
+                target, compiled = rel[:-3] + ".mpy", fake_mpy(data)
+                section["files"][target] = {"sha256": hashlib.sha256(compiled).hexdigest(), "size": len(compiled)}
+                blobs[f"{MPY_DIR}/{target}"] = compiled
+        manifest["mpy"] = section
+    if bundle:
+        contents = dict(files)
+        contents.update({rel[len(MPY_DIR) + 1:]: data for rel, data in blobs.items()})
+        blob = build_bundle(contents)
+        rel = f"bundles/{version}.bin"
+        blobs[rel] = blob
+        manifest["bundle"] = {"path": rel, "sha256": hashlib.sha256(blob).hexdigest(), "size": len(blob)}
+    return manifest, blobs
+
+
+class RepoServer:
+    def __init__(self, files, version, bundle=False, latency_ms=0, drop_after=None, drops=0, corrupt=(), mpy=False):
+        self.latency_ms = latency_ms
+        self.drop_after = drop_after
+        self.drops = drops
+        self.corrupt = set(corrupt)
+        self.publish(files, version, bundle, mpy)
+        self.requests = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self._server = None
+        self._writers = set()
+        self.port = None
+
+    def publish(self, files, version, bundle=False, mpy=False):
+        manifest, blobs = build_manifest(files, version, bundle, mpy)
+        self.files = dict(files)
+        self.files.update(blobs)
+        self.files["manifest.json"] = json.dumps(manifest).encode()
+        self.etag = '"%s"' % hashlib.sha256(self.files["manifest.json"]).hexdigest()[:16]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+    def counters(self):
+        return {"requests": self.requests, "bytes_sent": self.bytes_sent, "connections": self.connections}
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            while await self._serve_one(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _serve_one(self, reader, writer):
+        line = await reader.readline()
+        if not line:
+            return False
+        headers = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode().partition(":")
+            headers[k.strip().lower()] = v.strip()
+        self.requests += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        path = line.split()[1].decode().lstrip("/")
+        body = self.files.get(path)
+        if body is None:
+            return self._send(writer, 404, b"not found")
+        if path == "manifest.json" and headers.get("if-none-match") == self.etag:
+            return self._send(writer, 304, b"", {"ETag": self.etag})
+        if path in self.corrupt:
+            body = body[:-1] + bytes([body[-1] ^ 0xFF]) if body else b"x"
+        status, extra = 200, {"ETag": self.etag} if path == "manifest.json" else {}
+        rng = headers.get("range", "")
+        if rng.startswith("bytes="):
+            start = int(rng[6:].split("-")[0])
+            body, status = body[start:], 206
+            extra["Content-Range"] = f"bytes {start}-{start + len(body) - 1}/*"
+        if self.drops and self.drop_after is not None and len(body) > self.drop_after \
+                and path != "manifest.json":
+            self.drops -= 1
+            self._send(writer, status, body, extra, truncate=self.drop_after)
+            await writer.drain()
+            return False
+        self._send(writer, status, body, extra)
+        await writer.drain()
+        return headers.get("connection", "").lower() != "close"
+
+    def _send(self, writer, status, body, extra=None, truncate=None):
+        reason = {200: "OK", 206: "Partial Content", 304: "Not Modified", 404: "Not Found"}[status]
+        head = f"HTTP/1.1 {status} {reason}\r\nContent-Length: {len(body)}\r\n"
+        for k, v in (extra or {}).items():
+            head += f"{k}: {v}\r\n"
+        writer.write(head.encode() + b"\r\n")
+        payload = body if truncate is None else body[:truncate]
+        writer.write(payload)
+        self.bytes_sent += len(head) + 2 + len(payload)
+        return status != 404
@@ -0,0 +1,37 @@
+"""Host stand-in for MicroPython's deflate module (simulation only)."""
+
+import zlib
+
+AUTO, RAW, ZLIB, GZIP = 0, 1, 2, 3
+
+
+class DeflateIO:
+    def __init__(self, stream, format=AUTO, wbits=0, close=False):
+        self._stream = stream
+        wb = {RAW: -15, ZLIB: 15, GZIP: 31}.get(format, 47)
+        self._d = zlib.decompressobj(wb)
+        self._pending = b""
+
+    def _fill(self, n):
+        while len(self._pending) < n:
+            chunk = self._stream.read(256)
+            if not chunk:
+                self._pending += self._d.flush()
+                break
+            self._pending += self._d.decompress(chunk)
+
+    def read(self, n=-1):
+        if n < 0:
+            self._fill(1 << 30)
+            n = len(self._pending)
+        self._fill(n)
+        data, self._pending = self._pending[:n], self._pending[n:]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
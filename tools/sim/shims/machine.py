@@ -0,0 +1,99 @@
+"""Host stand-in for MicroPython's machine module (simulation only)."""
+
+import threading
+import time
+
+PWRON_RESET = 1
+WDT_RESET = 3
+
+
+class Reset(BaseException):
+    """Raised by reset() so a simulated reboot unwinds whatever called it."""
+
+
+class Pin:
+    IN, OUT, OPEN_DRAIN = 0, 1, 2
+    PULL_UP, PULL_DOWN = 1, 2
+
+    levels = {}  # Pin id -> level seen by inputs, e.g. Pin.levels[14] = 0 for "button held"
+
+    def __init__(self, id, mode=IN, pull=None, value=None):
+        self.id = id
+        self._value = Pin.levels.get(id, 1 if pull == Pin.PULL_UP else 0)
+        if value is not None:
+            self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def toggle(self):
+        self._value ^= 1
+
+
+class Timer:
+    """ Software timer; callbacks run on a host thread, as soft IRQs would between bytecodes """
+    ONE_SHOT, PERIODIC = 0, 1
+
+    def __init__(self, id=-1, **kwargs):
+        self._thread = None
+        self._gen = 0  # Bumped by init/deinit so a stale expiry does nothing
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, freq=None, period=1000, callback=None):
+        self.deinit()
+        gen = self._gen
+        period_s = 1 / freq if freq else period / 1000
+
+        def fire():
+            if self._gen != gen:
+                return
+            if mode == Timer.PERIODIC:
+                self._arm(fire, period_s)
+            if callback:
+                callback(self)
+
+        self._arm(fire, period_s)
+
+    def _arm(self, fire, period_s):
+        self._thread = threading.Timer(period_s, fire)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def deinit(self):
+        self._gen += 1
+        if self._thread:
+            self._thread.cancel()
+            self._thread = None
+
+
+def reset():
+    raise Reset()
+
+
+def soft_reset():
+    raise Reset()
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def unique_id():
+    return b"\xe6\x61\x38\x52\x43\x2a\x11\x22"
+
+
+def freq():
+    return 125_000_000
+
+
+def idle():
+    time.sleep(0)
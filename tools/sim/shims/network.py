@@ -0,0 +1,74 @@
+"""Host stand-in for MicroPython's network module (simulation only).
+
+A single access point is simulated; any password is accepted. Joins take
+JOIN_MS, or FAST_JOIN_MS when pinned to the AP's BSSID (and channel, if given). Set UP = False to
+simulate an outage.
+"""
+
+import time
+
+STA_IF, AP_IF = 0, 1
+STAT_IDLE, STAT_CONNECTING, STAT_GOT_IP = 0, 1, 3
+STAT_CONNECT_FAIL, STAT_NO_AP_FOUND, STAT_WRONG_PASSWORD = -1, -2, -3
+
+AP = {"ssid": "SIM", "bssid": b"\x02\x00\x00\x00\x00\x01", "channel": 6, "rssi": -55}
+JOIN_MS = 2500
+FAST_JOIN_MS = 300
+SCAN_MS = 1500
+UP = True
+LEASE = ("192.168.4.20", "255.255.255.0", "192.168.4.1", "192.168.4.1")
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self._active = False
+        self._status = STAT_IDLE
+        self._ready_at = 0
+        self._ifconfig = ("0.0.0.0",) * 4
+        self._static = None
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def scan(self):
+        time.sleep(SCAN_MS / 1000)  # Blocking, like the real driver
+        if not UP:
+            return []
+        return [(AP["ssid"].encode(), AP["bssid"], AP["channel"], AP["rssi"], 3, False)]
+
+    def connect(self, ssid, key=None, bssid=None, channel=0):
+        if not UP:
+            self._status = STAT_NO_AP_FOUND
+            return
+        if (bssid is not None and bssid != AP["bssid"]) or (channel and channel != AP["channel"]):
+            self._status = STAT_NO_AP_FOUND
+            return
+        delay = FAST_JOIN_MS if bssid else JOIN_MS
+        self._status = STAT_CONNECTING
+        self._ready_at = time.monotonic() + delay / 1000
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+
+    def status(self, param=None):
+        if self._status == STAT_CONNECTING and time.monotonic() >= self._ready_at:
+            self._status = STAT_GOT_IP
+            self._ifconfig = self._static or LEASE
+        if self._status == STAT_GOT_IP and not UP:
+            self._status = STAT_IDLE
+        return self._status
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return self._ifconfig
+        self._static = None if config == "dhcp" else tuple(config)
+
+    def config(self, *args, **kwargs):
+        if args and args[0] == "mac":
+            return b"\x28\xcd\xc1\x00\x00\x01"
+        return None
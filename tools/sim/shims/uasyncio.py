@@ -0,0 +1,45 @@
+"""Host stand-in for MicroPython's uasyncio on top of CPython asyncio (simulation only)."""
+
+import asyncio as _asyncio
+from asyncio import *  # noqa: F401,F403
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+async def _readinto(self, buf):
+    data = await self.read(len(buf))
+    buf[:len(data)] = data
+    return len(data)
+
+
+StreamReader.readinto = _readinto  # noqa: F405
+
+
+# MicroPython has one global loop, so tasks may be created before run() is
+# called (main.py starts WiFiManager that way); CPython needs a loop for that.
+_loop = None
+
+
+def _default_loop():
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = _asyncio.new_event_loop()
+        _asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def get_event_loop():
+    try:
+        return _asyncio.get_running_loop()
+    except RuntimeError:
+        return _default_loop()
+
+
+def create_task(coro):
+    return get_event_loop().create_task(coro)
+
+
+def run(main):
+    return _default_loop().run_until_complete(main)
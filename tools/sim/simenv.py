@@ -0,0 +1,241 @@
+"""Run the firmware's real modules on CPython against a simulated device.
+
+setup(flash_dir) does three things:
+
+* puts tools/sim/shims first on sys.path, so `machine`, `network`,
+  `uasyncio` and `deflate` resolve to host stand-ins;
+* patches `time` with MicroPython's ticks_* / sleep_ms and `gc` with
+  mem_free / mem_alloc / threshold (heap figures come from tracemalloc
+  against a nominal HEAP_SIZE), and shrinks asyncio's socket reads to one
+  TCP segment as on the device;
+* imports every module from lib/ (and main.py via run_main) through a
+  finder that gives it sandboxed builtins: `import os` yields a view of
+  os rooted at flash_dir and `open` is redirected there too, with every
+  byte written counted in STATS.
+
+Nothing in the firmware is modified; absolute device paths like
+"/update/lib/ota.py" simply land under flash_dir.
+"""
+
+import builtins
+import gc
+import importlib.abc
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(SIM_DIR))
+SHIMS = os.path.join(SIM_DIR, "shims")
+HEAP_SIZE = 200 * 1024  # Roughly what a Pico W leaves to Python code
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.flash_written = 0
+        self.files_written = 0
+
+
+STATS = Stats()
+_flash = None
+_cwd = "/"
+
+
+def flash_path(path):
+    """ Map a device path (absolute or relative to the simulated cwd) into flash_dir """
+    if not path.startswith("/"):
+        path = _cwd.rstrip("/") + "/" + path
+    return os.path.join(_flash, path.lstrip("/"))
+
+
+class _CountingFile:
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, data):
+        STATS.flash_written += len(data)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __iter__(self):
+        return iter(self._f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+        return False
+
+
+def _open(path, mode="r", *args, **kwargs):
+    f = builtins.open(flash_path(path), mode, *args, **kwargs)
+    if any(c in mode for c in "wax+"):
+        STATS.files_written += 1
+        return _CountingFile(f)
+    return f
+
+
+class _FlashOS:
+    """ The subset of MicroPython's os module the firmware uses, rooted at flash_dir """
+
+    sep = "/"
+
+    def stat(self, path):
+        st = os.stat(flash_path(path))
+        mode = 0x4000 if os.path.isdir(flash_path(path)) else 0x8000
+        return (mode, 0, 0, 0, 0, 0, st.st_size, int(st.st_atime), int(st.st_mtime), int(st.st_ctime))
+
+    def listdir(self, path="."):
+        return sorted(os.listdir(flash_path(path)))
+
+    def ilistdir(self, path="."):
+        for name in self.listdir(path):
+            full = (path.rstrip("/") + "/" + name) if path not in ("", ".") else name
+            yield (name, self.stat(full)[0], 0, self.stat(full)[6])
+
+    def mkdir(self, path):
+        os.mkdir(flash_path(path))
+
+    def rmdir(self, path):
+        os.rmdir(flash_path(path))
+
+    def remove(self, path):
+        os.remove(flash_path(path))
+
+    def rename(self, old, new):
+        os.replace(flash_path(old), flash_path(new))
+
+    def chdir(self, path):
+        global _cwd
+        if not os.path.isdir(flash_path(path)):
+            raise OSError(2, "ENOENT")
+        _cwd = path if path.startswith("/") else _cwd.rstrip("/") + "/" + path
+
+    def getcwd(self):
+        return _cwd
+
+    def statvfs(self, path):
+        # 2 MB littlefs-like volume: (bsize, frsize, blocks, bfree, bavail, ...)
+        blocks, bsize = 512, 4096
+        used = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(_flash) for f in fs)
+        free = max(0, blocks - (used + bsize - 1) // bsize)
+        return (bsize, bsize, blocks, free, free, 0, 0, 0, 0, 255)
+
+    def uname(self):
+        return ("rp2", "sim", "sim", "sim", "Raspberry Pi Pico W (simulated)")
+
+
+FLASH_OS = _FlashOS()
+_real_import = builtins.__import__
+
+
+def _sandboxed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if name == "os" and not fromlist:
+        return FLASH_OS
+    return _real_import(name, globals, locals, fromlist, level)
+
+
+SANDBOX_BUILTINS = dict(vars(builtins))
+SANDBOX_BUILTINS["__import__"] = _sandboxed_import
+SANDBOX_BUILTINS["open"] = _open
+
+
+class _FirmwareLoader(importlib.abc.Loader):
+    def __init__(self, path):
+        self.path = path
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        module.__dict__["__builtins__"] = SANDBOX_BUILTINS
+        with builtins.open(self.path) as f:
+            code = compile(f.read(), self.path, "exec")
+        exec(code, module.__dict__)
+
+
+class _FirmwareFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        candidate = os.path.join(REPO, "lib", name + ".py")
+        if "." not in name and os.path.isfile(candidate):
+            return importlib.util.spec_from_loader(name, _FirmwareLoader(candidate), origin=candidate)
+        return None
+
+
+def _patch_time():
+    t0 = time.monotonic()
+    time.ticks_ms = lambda: int((time.monotonic() - t0) * 1000) & 0x3FFFFFFF
+    time.ticks_us = lambda: int((time.monotonic() - t0) * 1_000_000) & 0x3FFFFFFF
+
+    def ticks_diff(a, b):
+        d = (a - b) & 0x3FFFFFFF
+        return d - 0x40000000 if d & 0x20000000 else d
+
+    time.ticks_diff = ticks_diff
+    time.ticks_add = lambda a, b: (a + b) & 0x3FFFFFFF
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1_000_000)
+
+
+def _patch_gc():
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = lambda: max(0, HEAP_SIZE - mem_alloc())
+    gc.threshold = lambda *args: -1
+
+
+def _patch_transport():
+    # CPython's socket transport reads with 256 KB recv() buffers, which would
+    # dominate every peak-heap figure; lwIP hands the device one TCP segment
+    from asyncio import selector_events
+    selector_events._SelectorTransport.max_size = 1460
+
+
+def setup(flash_dir):
+    """ Prepare the process to run firmware modules against flash_dir """
+    global _flash, _cwd
+    _flash = os.path.abspath(flash_dir)
+    _cwd = "/"
+    os.makedirs(_flash, exist_ok=True)
+    if SHIMS not in sys.path:
+        sys.path.insert(0, SHIMS)
+    if not any(isinstance(f, _FirmwareFinder) for f in sys.meta_path):
+        sys.meta_path.insert(0, _FirmwareFinder())
+        _patch_time()
+        _patch_gc()
+        _patch_transport()
+    STATS.reset()
+
+
+def unload_firmware():
+    """ Forget imported firmware modules so the next import starts fresh """
+    for name in list(sys.modules):
+        if os.path.isfile(os.path.join(REPO, "lib", name + ".py")):
+            del sys.modules[name]
+
+
+def run_main(path=None):
+    """ Execute main.py as the device would after boot.py """
+    path = path or os.path.join(REPO, "main.py")
+    with builtins.open(path) as f:
+        code = compile(f.read(), path, "exec")
+    exec(code, {"__name__": "__main__", "__builtins__": SANDBOX_BUILTINS})
+
+
+def install_tree(files):
+    """ Write {device path: bytes} into flash """
+    for rel, data in files.items():
+        dest = flash_path(rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with builtins.open(dest, "wb") as f:
+            f.write(data)